@@ -0,0 +1,239 @@
+import numpy as np
+import pandas as pd
+from bokeh.plotting import figure
+from bokeh.models import ColumnDataSource, HoverTool, LinearColorMapper, ColorBar, TabPanel, Tabs
+from bokeh.embed import file_html
+from bokeh.resources import INLINE
+from openpyxl.styles import Font, PatternFill, Alignment
+from openpyxl.formatting.rule import ColorScaleRule
+
+
+# Cửa sổ (số phiên) cho ma trận tương quan
+CORRELATION_WINDOWS = [60, 252]
+
+# Số phiên cho bảng tóm tắt spread (min/max/avg 1 năm)
+SPREAD_SUMMARY_DAYS = 252
+
+# Số bar Close gần nhất mỗi ticker cần giữ cho sheet phân tích (mọi phép tính chỉ dùng phần đuôi này)
+ANALYTICS_LOOKBACK = max(max(CORRELATION_WINDOWS) + 1, SPREAD_SUMMARY_DAYS)
+
+# Spread tuyến tính: {tên: {ticker: hệ số}} (RB/HO tính theo $/gallon -> x42 ra $/thùng)
+SPREADS = {
+    'Brent - WTI ($/bbl)': {'BZ=F': 1.0, 'CL=F': -1.0},
+    '3-2-1 Crack Spread ($/bbl)': {'RB=F': 2 * 42 / 3, 'HO=F': 42 / 3, 'CL=F': -1.0},
+    'Gasoline Crack ($/bbl)': {'RB=F': 42.0, 'CL=F': -1.0},
+    'Heating Oil Crack ($/bbl)': {'HO=F': 42.0, 'CL=F': -1.0},
+}
+
+# Tỷ lệ giá: {tên: (tử số, mẫu số)}
+RATIOS = {
+    'Gold / Silver': ('GC=F', 'SI=F'),
+    'Platinum / Palladium': ('PL=F', 'PA=F'),
+    'Gold / Copper': ('GC=F', 'HG=F'),
+}
+
+
+def build_close_pivot(close_series):
+    """
+    Ghép các chuỗi Close {ticker: Series} thành bảng rộng: index = ngày, mỗi cột = 1 ticker.
+    Mọi phép tính phía sau chỉ dùng bảng này.
+    """
+    pivot = pd.DataFrame(close_series).sort_index()
+    pivot.columns.name = None
+    return pivot
+
+
+def correlation_matrix(pivot, window):
+    """
+    Ma trận tương quan log-return trên 'window' phiên gần nhất, cho TẤT CẢ cặp ticker cùng lúc.
+    Dùng phép nhân ma trận (BLAS) thay vì lặp từng cặp; mỗi cặp chỉ tính trên
+    các ngày cả hai ticker đều có dữ liệu (pairwise-complete).
+    """
+    returns = np.log(pivot).diff().iloc[1:].tail(window)
+    x = returns.to_numpy(dtype=float)
+    mask = (~np.isnan(x)).astype(float)
+    x = np.where(mask > 0, x, 0.0)
+
+    n = mask.T @ mask              # Số quan sát chung của từng cặp
+    sum_x = x.T @ mask             # sum_x[i, j] = tổng x_i trên các ngày chung với j
+    sum_xx = (x * x).T @ mask
+    sum_xy = x.T @ x
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sum_xy - sum_x * sum_x.T / n
+        var_x = sum_xx - sum_x ** 2 / n
+        corr = cov / np.sqrt(var_x * var_x.T)
+
+    corr[n < 3] = np.nan
+    np.fill_diagonal(corr, 1.0)
+    return pd.DataFrame(np.clip(corr, -1, 1), index=pivot.columns, columns=pivot.columns)
+
+
+def compute_spreads(pivot):
+    """
+    Tính tất cả spread (tuyến tính) và tỷ lệ giá trên bảng rộng, vectorized:
+    spread = giá @ ma trận hệ số, ratio = cột tử / cột mẫu.
+    Chỉ giữ các spread/ratio có đủ ticker. Trả về DataFrame index = ngày, mỗi cột = 1 spread.
+    """
+    parts = []
+
+    spreads = {name: legs for name, legs in SPREADS.items() if set(legs) <= set(pivot.columns)}
+    if spreads:
+        tickers = sorted(set().union(*spreads.values()))
+        weights = pd.DataFrame(0.0, index=tickers, columns=list(spreads))
+        for name, legs in spreads.items():
+            weights.loc[list(legs), name] = list(legs.values())
+
+        prices = pivot[tickers].to_numpy(dtype=float)
+        missing = np.isnan(prices)
+        values = np.where(missing, 0.0, prices) @ weights.to_numpy()
+        # Ngày thiếu giá của bất kỳ chân nào trong spread -> NaN
+        values[(missing.astype(float) @ (weights.to_numpy() != 0)) > 0] = np.nan
+        parts.append(pd.DataFrame(values, index=pivot.index, columns=weights.columns))
+
+    ratios = {name: legs for name, legs in RATIOS.items() if set(legs) <= set(pivot.columns)}
+    if ratios:
+        numerators = pivot[[a for a, _ in ratios.values()]].to_numpy(dtype=float)
+        denominators = pivot[[b for _, b in ratios.values()]].to_numpy(dtype=float)
+        parts.append(pd.DataFrame(numerators / denominators, index=pivot.index, columns=list(ratios)))
+
+    if not parts:
+        return pd.DataFrame(index=pivot.index)
+    return pd.concat(parts, axis=1)
+
+
+def summarize_spreads(spreads, period_days=SPREAD_SUMMARY_DAYS):
+    """Bảng tóm tắt mỗi spread: giá trị mới nhất, thay đổi 1 tháng, min/max/avg 1 năm, percentile"""
+    recent = spreads.tail(period_days)
+    latest = recent.ffill().iloc[-1]
+    month_ago = recent.ffill().iloc[-22] if len(recent) > 21 else recent.iloc[0]
+    return pd.DataFrame({
+        'Latest': latest,
+        'Change 1M': latest - month_ago,
+        '1Y Min': recent.min(),
+        '1Y Max': recent.max(),
+        '1Y Avg': recent.mean(),
+        '1Y Percentile %': (recent <= latest).sum() / recent.notna().sum() * 100,
+    })
+
+
+def write_analytics_sheet(wb, pivot, names=None, heatmap_link=None, sheet_title="Correlation & Spreads"):
+    """
+    Thêm sheet tương quan + spread vào workbook 'wb' (dùng chung 1 bảng pivot giá Close).
+    """
+    names = names or {}
+    ws = wb.create_sheet(sheet_title)
+    header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
+    header_font = Font(bold=True, color='FFFFFF')
+    current_row = 1
+
+    ws.cell(row=current_row, column=1, value='Cross-Commodity Correlation & Spreads').font = Font(bold=True, size=16, color='2C3E50')
+    current_row += 1
+    if heatmap_link:
+        cell_link = ws.cell(row=current_row, column=1, value='Click to open heatmap')
+        cell_link.hyperlink = heatmap_link
+        cell_link.style = 'Hyperlink'
+    current_row += 2
+
+    # --- A. Spread & Ratio ---
+    spreads = compute_spreads(pivot)
+    if not spreads.empty:
+        summary = summarize_spreads(spreads)
+        headers = ['Spread / Ratio'] + list(summary.columns)
+        for col_idx, header in enumerate(headers, start=1):
+            cell = ws.cell(row=current_row, column=col_idx, value=header)
+            cell.fill = header_fill
+            cell.font = header_font
+            cell.alignment = Alignment(horizontal='center')
+        for name, row in summary.iterrows():
+            current_row += 1
+            ws.cell(row=current_row, column=1, value=name)
+            for col_idx, value in enumerate(row, start=2):
+                ws.cell(row=current_row, column=col_idx, value=float(value) if pd.notna(value) else None).number_format = '#,##0.00'
+        current_row += 3
+
+    # --- B. Ma trận tương quan ---
+    tickers = list(pivot.columns)
+    for window in CORRELATION_WINDOWS:
+        corr = correlation_matrix(pivot, window)
+        ws.cell(row=current_row, column=1, value=f'Correlation of daily log returns - last {window} sessions').font = Font(bold=True, size=12)
+        current_row += 1
+
+        top_row = current_row
+        for col_idx, ticker in enumerate(tickers, start=2):
+            cell = ws.cell(row=top_row, column=col_idx, value=ticker)
+            cell.fill = header_fill
+            cell.font = header_font
+            cell.alignment = Alignment(horizontal='center')
+        for row_idx, ticker in enumerate(tickers, start=top_row + 1):
+            ws.cell(row=row_idx, column=1, value=f"{names.get(ticker, ticker)} ({ticker})").font = Font(bold=True)
+            for col_idx, value in enumerate(corr.loc[ticker].to_numpy(), start=2):
+                ws.cell(row=row_idx, column=col_idx, value=float(value) if pd.notna(value) else None).number_format = '0.00'
+
+        # Tô màu bằng conditional formatting (Excel tự render)
+        first_cell = ws.cell(row=top_row + 1, column=2).coordinate
+        last_cell = ws.cell(row=top_row + len(tickers), column=1 + len(tickers)).coordinate
+        ws.conditional_formatting.add(f'{first_cell}:{last_cell}', ColorScaleRule(
+            start_type='num', start_value=-1, start_color='EF5350',
+            mid_type='num', mid_value=0, mid_color='FFFFFF',
+            end_type='num', end_value=1, end_color='26A69A'))
+        current_row = top_row + len(tickers) + 3
+
+    ws.column_dimensions['A'].width = 30
+    return ws
+
+
+def create_correlation_heatmap(pivot, output_html, names=None):
+    """Trang Bokeh heatmap tương quan (mỗi cửa sổ 1 tab), style dark giống các chart giá."""
+    names = names or {}
+    tickers = list(pivot.columns)
+    mapper = LinearColorMapper(palette=['#EF5350', '#F28B82', '#F6BDB9', '#363A45', '#A7D7D2', '#66BFB5', '#26A69A'], low=-1, high=1)
+
+    panels = []
+    for window in CORRELATION_WINDOWS:
+        corr = correlation_matrix(pivot, window)
+        values = corr.to_numpy().ravel()
+        source = ColumnDataSource(data={
+            'x': np.tile(tickers, len(tickers)),
+            'y': np.repeat(tickers, len(tickers)),
+            'x_name': [names.get(t, t) for t in np.tile(tickers, len(tickers))],
+            'y_name': [names.get(t, t) for t in np.repeat(tickers, len(tickers))],
+            'corr': values,
+            'corr_str': [f"{v:.2f}" if pd.notna(v) else "N/A" for v in values],
+        })
+
+        p = figure(
+            title=f"Correlation - last {window} sessions",
+            x_range=tickers, y_range=list(reversed(tickers)),
+            width=900, height=800,
+            tools="hover,save,reset", toolbar_location="right",
+            sizing_mode='scale_width', x_axis_location='above'
+        )
+        p.rect('x', 'y', width=1, height=1, source=source,
+               fill_color={'field': 'corr', 'transform': mapper}, line_color='#1E222D')
+        p.text('x', 'y', text='corr_str', source=source, text_align='center', text_baseline='middle',
+               text_font_size='9pt', text_color='#D1D4DC')
+        p.select_one(HoverTool).tooltips = [('Pair', '@y_name / @x_name'), ('Correlation', '@corr_str')]
+        p.add_layout(ColorBar(color_mapper=mapper, background_fill_color='#1E222D',
+                              major_label_text_color='#787B86'), 'right')
+
+        # Styling giống các chart giá (dark theme)
+        p.title.text_font_size = '16pt'
+        p.title.text_color = '#D1D4DC'
+        p.background_fill_color = '#1E222D'
+        p.border_fill_color = '#1E222D'
+        p.outline_line_color = '#363A45'
+        p.grid.grid_line_color = None
+        p.axis.axis_line_color = None
+        p.axis.major_tick_line_color = None
+        p.axis.major_label_text_color = '#787B86'
+        p.xaxis.major_label_orientation = 0.8
+        p.toolbar.logo = None
+
+        panels.append(TabPanel(child=p, title=f"{window} sessions"))
+
+    html_content = file_html(Tabs(tabs=panels), resources=INLINE, title="Commodity Correlation Heatmap")
+    with open(output_html, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+    print(f"    Đã tạo heatmap tương quan: {output_html}")
+    return output_html
@@ -0,0 +1,116 @@
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """Nguồn dữ liệu đang bị 'ngắt mạch' (lỗi liên tiếp) -> bỏ qua, không gọi nữa."""
+    pass
+
+
+class Deadline:
+    """
+    Hạn chót cho cả một bước (stage) của pipeline.
+    pause()/resume(): tạm dừng đếm giờ khi bên gọi đang làm việc khác (vd: vẽ chart giữa 2 lần tải).
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self.paused_at = None
+
+    def pause(self):
+        if self.paused_at is None:
+            self.paused_at = time.monotonic()
+
+    def resume(self):
+        if self.paused_at is not None:
+            self.expires_at += time.monotonic() - self.paused_at
+            self.paused_at = None
+
+    def remaining(self):
+        now = self.paused_at if self.paused_at is not None else time.monotonic()
+        return max(0.0, self.expires_at - now)
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+def run_with_timeout(func, timeout, *args, **kwargs):
+    """
+    Chạy func trong 1 thread daemon, chờ tối đa 'timeout' giây.
+    Nếu quá hạn -> raise TimeoutError (thread treo bị bỏ lại, không chặn việc thoát chương trình).
+    """
+    result = {}
+
+    def target():
+        try:
+            result['value'] = func(*args, **kwargs)
+        except BaseException as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+
+    if thread.is_alive():
+        raise TimeoutError(f"quá thời gian chờ {timeout:.0f}s")
+    if 'error' in result:
+        raise result['error']
+    return result['value']
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker cho 1 nguồn dữ liệu (host).
+    Sau 'failure_threshold' lỗi LIÊN TIẾP -> mở mạch, mọi lần gọi bị từ chối ngay
+    trong 'reset_timeout' giây; sau đó cho thử lại 1 lần (half-open).
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=300):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def is_open(self):
+        if self.opened_at is None:
+            return False
+        # Hết thời gian chờ -> half-open (cho phép thử lại)
+        return time.monotonic() - self.opened_at < self.reset_timeout
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None or not self.is_open:
+                print(f"  CẢNH BÁO: Ngắt mạch nguồn '{self.name}' sau {self.failures} lỗi liên tiếp.")
+            self.opened_at = time.monotonic()
+
+    def call(self, func, *args, timeout=None, deadline=None, **kwargs):
+        """
+        Gọi func qua circuit breaker, giới hạn bởi 'timeout' (giây) và 'deadline' của stage.
+        """
+        if deadline is not None and deadline.expired():
+            raise TimeoutError(f"hết thời gian cho phép của stage ({deadline.seconds:.0f}s)")
+        if self.is_open:
+            raise CircuitOpenError(f"nguồn '{self.name}' đang bị ngắt mạch")
+
+        if deadline is not None:
+            timeout = deadline.remaining() if timeout is None else min(timeout, deadline.remaining())
+
+        try:
+            if timeout is None:
+                value = func(*args, **kwargs)
+            else:
+                value = run_with_timeout(func, timeout, *args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+
+        self.record_success()
+        return value
@@ -0,0 +1,138 @@
+import os
+import numpy as np
+import pandas as pd
+from price_store import history_file, save_ticker_history
+
+
+# Thư mục cache chỉ báo: MỖI ticker 1 file, cùng cách đặt tên với lịch sử giá (xem price_store.py)
+# -> chế độ streaming chỉ đọc/ghi cache của ticker đang xử lý
+INDICATORS_DIR = os.path.join('data', 'indicators')
+
+MA_WINDOWS = [20, 50, 200]
+VOLATILITY_WINDOW = 20  # Độ biến động: std 20 phiên của daily return, annualized
+ZSCORE_WINDOW = 20      # Z-score của giá so với MA20
+
+INDICATOR_COLUMNS = [f'MA{w}' for w in MA_WINDOWS] + ['Volatility', 'Drawdown', 'ZScore']
+
+
+def compute_indicators(df):
+    """
+    Tính chỉ báo kỹ thuật cho TẤT CẢ tickers trong MỘT lượt vectorized
+    (groupby + rolling), không lặp từng dòng / từng commodity.
+
+    Input: DataFrame dạng long (index 'date', cột 'Close' và 'name').
+    Output: DataFrame index 'date', cột 'name' + INDICATOR_COLUMNS.
+    """
+    if 'date' in df.columns:
+        df = df.set_index('date')
+
+    data = df[['name', 'Close']].rename_axis('date').reset_index()
+    data = data.sort_values(['name', 'date'], kind='stable').reset_index(drop=True)
+    by_name = data.groupby('name', sort=False)
+
+    def rolling(column, window):
+        # groupby().rolling() trả về MultiIndex (name, row) -> bỏ level 'name' để khớp lại với 'data'
+        return by_name[column].rolling(window, min_periods=window)
+
+    # Moving averages
+    for window in MA_WINDOWS:
+        data[f'MA{window}'] = rolling('Close', window).mean().reset_index(level=0, drop=True)
+
+    # Rolling volatility (%/năm)
+    data['Return'] = by_name['Close'].pct_change()
+    data['Volatility'] = rolling('Return', VOLATILITY_WINDOW).std().reset_index(level=0, drop=True) * np.sqrt(252) * 100
+
+    # Drawdown từ đỉnh (%)
+    data['Drawdown'] = (data['Close'] / by_name['Close'].cummax() - 1) * 100
+
+    # Z-score của giá
+    rolling_std = rolling('Close', ZSCORE_WINDOW).std().reset_index(level=0, drop=True)
+    data['ZScore'] = (data['Close'] - data[f'MA{ZSCORE_WINDOW}']) / rolling_std
+
+    return data.set_index('date')[['name'] + INDICATOR_COLUMNS]
+
+
+# Số bar lịch sử cần lấy lại trước phần mới để các cửa sổ rolling (dài nhất MA200) tính đúng
+LOOKBACK = max(MA_WINDOWS + [VOLATILITY_WINDOW + 1, ZSCORE_WINDOW])
+
+
+def _read_cache(ticker, cache_dir):
+    """Đọc cache chỉ báo của 1 ticker (index 'date', cột 'name', 'Close' + INDICATOR_COLUMNS) hoặc None"""
+    path = history_file(ticker, cache_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        cached = pd.read_pickle(path)
+    except Exception as e:
+        print(f"  CẢNH BÁO: Không đọc được cache chỉ báo của '{ticker}' ({e}). Tính lại.")
+        return None
+    if not isinstance(cached, pd.DataFrame) or 'Close' not in cached.columns:
+        return None
+    return cached
+
+
+def _cached_prefix_length(cached, frame):
+    """
+    Số dòng đầu của 'frame' (1 ticker, sort theo ngày) trùng khớp (ngày + Close) với cache.
+    Đầu cửa sổ lịch sử có thể dịch về sau (period '2y' trượt) -> so từ ngày đầu tiên của 'frame'.
+    Bar cuối lần trước có thể bị Yahoo sửa lại -> chỉ giữ phần trùng khớp liên tục tính từ đầu.
+    """
+    if cached is None or frame.empty:
+        return 0
+    overlap = cached[cached.index >= frame.index[0]]
+    n = min(len(overlap), len(frame))
+    same = (frame.index[:n] == overlap.index[:n]) & (frame['Close'].to_numpy()[:n] == overlap['Close'].to_numpy()[:n])
+    return n if same.all() else int(np.argmin(same))
+
+
+def load_or_compute_indicators(df, cache_dir=INDICATORS_DIR):
+    """
+    Như compute_indicators nhưng có cache TĂNG DẦN: phần lịch sử trùng với lần trước giữ nguyên
+    kết quả cũ, chỉ tính (vectorized, 1 lượt cho mọi ticker) các bar MỚI cùng LOOKBACK bar trước đó.
+
+    Drawdown phụ thuộc đỉnh từ đầu cửa sổ (cummax) mà đầu cửa sổ trượt theo mỗi lần tải,
+    nên được tính lại trên toàn bộ (1 lượt groupby cummax, O(n), không có cửa sổ rolling).
+
+    Cache lưu theo từng ticker -> chỉ đọc/ghi file của các ticker có trong 'df'
+    (chế độ streaming gọi cho 1 ticker: bộ nhớ và I/O chỉ cỡ 1 ticker).
+    """
+    if 'date' in df.columns:
+        df = df.set_index('date')
+    df = df.rename_axis('date')
+
+    kept = []          # Phần chỉ báo lấy lại từ cache
+    to_compute = []    # Phần cần tính: LOOKBACK bar cũ + các bar mới
+    tail_start = {}    # Ngày bắt đầu phần mới của từng ticker
+    to_save = set()    # Ticker cần ghi lại cache (có phần mới hoặc đầu cửa sổ đã trượt)
+    for ticker, frame in df.groupby('name', sort=False):
+        frame = frame.sort_index()
+        cached = _read_cache(ticker, cache_dir)
+        n_cached = _cached_prefix_length(cached, frame)
+        if n_cached:
+            kept.append(cached[cached.index >= frame.index[0]].iloc[:n_cached])
+            if n_cached != len(cached):
+                to_save.add(ticker)
+        if n_cached < len(frame):
+            to_compute.append(frame.iloc[max(0, n_cached - LOOKBACK):])
+            tail_start[ticker] = frame.index[n_cached]
+            to_save.add(ticker)
+
+    print(f"  Chỉ báo kỹ thuật: dùng cache cho {len(kept)} ticker, tính phần mới cho {len(tail_start)} ticker.")
+
+    parts = list(kept)
+    if to_compute:
+        new_data = pd.concat(to_compute)
+        computed = compute_indicators(new_data)
+        computed['Close'] = new_data[['name', 'Close']].rename_axis('date').reset_index() \
+            .sort_values(['name', 'date'], kind='stable')['Close'].to_numpy()
+        # Bỏ các bar lookback (đã có trong cache), chỉ giữ phần mới
+        parts.append(computed[computed.index >= computed['name'].map(tail_start).to_numpy()])
+
+    indicators = pd.concat(parts)
+    indicators['Drawdown'] = (indicators['Close'] / indicators.groupby('name', sort=False)['Close'].cummax() - 1) * 100
+    indicators = indicators[['name', 'Close'] + INDICATOR_COLUMNS]
+
+    for ticker, frame in indicators[indicators['name'].isin(to_save)].groupby('name', sort=False):
+        save_ticker_history(frame, ticker, cache_dir)  # Ghi file tạm rồi đổi tên (atomic)
+
+    return indicators[['name'] + INDICATOR_COLUMNS]
@@ -0,0 +1,174 @@
+"""
+Bokeh server app: biểu đồ giá cập nhật liên tục (live), dùng chung style với file HTML tĩnh.
+
+Chạy:
+    bokeh serve --show live_charts.py --args CL=F
+    bokeh serve --show live_charts.py --args CL=F --fake --interval 2   # feed giả để test local
+
+Lịch sử chỉ load MỘT lần lúc mở trang; sau đó mỗi lần cập nhật chỉ đẩy các bar MỚI
+vào ColumnDataSource bằng stream() (có rollover), không dựng lại toàn bộ biểu đồ.
+"""
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+from bokeh.io import curdoc
+from bokeh.models import ColumnDataSource
+
+from yahoo_charts import COMMODITY_NAMES, calculate_returns, build_bokeh_source_data, build_bokeh_figure, infer_date_format
+from price_store import HISTORY_DIR, history_file, load_history
+from resampling import session_dates
+
+
+DEFAULT_INTERVAL_SECONDS = 60
+
+
+def history_feed(history_dir=HISTORY_DIR):
+    """
+    Feed đọc từ file lịch sử local của ticker (do main.py cập nhật theo lịch).
+    Chỉ đọc lại file khi file thay đổi (mtime), trả về các giá Close mới hơn 'last_date'.
+    """
+    state = {'mtime': None}
+
+    def feed(ticker, last_date, last_close):
+        history_path = history_file(ticker, history_dir)
+        if not os.path.exists(history_path):
+            return None
+        mtime = os.path.getmtime(history_path)
+        if mtime == state['mtime']:
+            return None
+        state['mtime'] = mtime
+
+        data = load_history(history_dir, ticker=ticker)
+        return data.loc[data.index > last_date, 'Close']
+
+    return feed
+
+
+def fake_feed(step=pd.Timedelta(days=1), volatility=0.01, seed=None):
+    """Feed giả (random walk), mỗi lần gọi sinh ra 1 bar mới. Dùng để test local."""
+    rng = np.random.default_rng(seed)
+
+    def feed(ticker, last_date, last_close):
+        new_date = last_date + step
+        new_close = last_close * (1 + rng.normal(0, volatility))
+        return pd.Series([new_close], index=[new_date], name='Close')
+
+    return feed
+
+
+def fake_history(ticker, periods=252, start_price=100.0, seed=None):
+    """Sinh lịch sử giả (random walk) cho 1 ticker, dùng khi test local chưa có file lịch sử."""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=periods)
+    closes = start_price * np.cumprod(1 + rng.normal(0, 0.01, periods))
+    history = pd.DataFrame({'Close': closes, 'name': ticker}, index=dates)
+    history.index.name = 'date'
+    return history
+
+
+def _new_bars_data(new_close, state):
+    """
+    Chuẩn bị dữ liệu cho stream() từ các bar mới (và cập nhật 'state').
+    Daily % so với giá đóng cửa của PHIÊN trước, giống calculate_returns -> chỉ cần nhớ
+    giá đóng cửa phiên trước, O(số bar mới), không tính lại cả lịch sử.
+    """
+    daily = []
+    for session, close in zip(session_dates(new_close.index), new_close.to_numpy(dtype=float)):
+        if session != state['session']:
+            # Bar đầu tiên của phiên mới -> giá cuối của phiên cũ là giá đóng cửa phiên trước
+            state['prev_session_close'] = state['last_close']
+            state['session'] = session
+        daily.append((close / state['prev_session_close'] - 1) * 100)
+        state['last_close'] = close
+    state['last_date'] = new_close.index[-1]
+
+    bars = pd.DataFrame({'Close': new_close.to_numpy(dtype=float), 'Daily': daily}, index=new_close.index)
+    return {k: list(v) for k, v in build_bokeh_source_data(bars, state['date_format']).items()}
+
+
+def make_live_document(doc, ticker, feed, history=None, interval_seconds=DEFAULT_INTERVAL_SECONDS,
+                       rollover=None, period_years=1, history_dir=HISTORY_DIR):
+    """
+    Dựng document Bokeh cho 1 ticker và đăng ký callback định kỳ để stream các bar mới.
+    'rollover' mặc định = số bar của cửa sổ ban đầu (giữ cố định độ dài biểu đồ).
+    """
+    if history is None:
+        history = load_history(history_dir, ticker=ticker)
+    if history is None or history.empty:
+        raise ValueError(f"LỖI: Không có lịch sử cho '{ticker}' trong '{history_dir}'. Hãy chạy main.py trước (hoặc dùng --fake).")
+
+    commodity_data = calculate_returns(history['Close'])
+    cutoff_date = commodity_data.index.max() - pd.DateOffset(years=period_years)
+    commodity_data = commodity_data[commodity_data.index >= cutoff_date]
+    if rollover is None:
+        rollover = len(commodity_data)
+
+    commodity_name = COMMODITY_NAMES.get(ticker, ticker)
+    full_name = f"{commodity_name} ({ticker}) - Live"
+
+    source = ColumnDataSource(data=build_bokeh_source_data(commodity_data))
+    p = build_bokeh_figure(source, full_name)
+
+    # Phiên hiện tại + giá đóng cửa phiên trước (để tính Daily cho các bar stream sau này)
+    sessions = session_dates(commodity_data.index)
+    previous = commodity_data['Close'][sessions < sessions[-1]]
+    state = {
+        'last_date': commodity_data.index[-1],
+        'last_close': float(commodity_data['Close'].iloc[-1]),
+        'session': sessions[-1],
+        'prev_session_close': float(previous.iloc[-1]) if len(previous) else np.nan,
+        'date_format': infer_date_format(commodity_data.index),
+    }
+
+    def update():
+        new_close = feed(ticker, state['last_date'], state['last_close'])
+        if new_close is None or new_close.empty:
+            return
+
+        source.stream(_new_bars_data(new_close, state), rollover=rollover)
+
+        # Chỉ nới rộng trục Y khi giá mới vượt ra ngoài (không quét lại toàn bộ source)
+        new_min, new_max = new_close.min(), new_close.max()
+        padding = (p.y_range.end - p.y_range.start) * 0.05
+        if new_min < p.y_range.start:
+            p.y_range.start = new_min - padding
+        if new_max > p.y_range.end:
+            p.y_range.end = new_max + padding
+
+    doc.add_root(p)
+    doc.title = full_name
+    doc.add_periodic_callback(update, int(interval_seconds * 1000))
+    return doc
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Bokeh server: biểu đồ giá live cho 1 ticker")
+    parser.add_argument('ticker', nargs='?', default='CL=F')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL_SECONDS,
+                        help="Chu kỳ cập nhật (giây)")
+    parser.add_argument('--rollover', type=int, default=None,
+                        help="Số bar tối đa giữ trên biểu đồ (mặc định: bằng cửa sổ 1 năm ban đầu)")
+    parser.add_argument('--history', default=HISTORY_DIR, help="Thư mục lịch sử giá local")
+    parser.add_argument('--fake', action='store_true', help="Dùng feed giả (random walk) để test local")
+    return parser.parse_args(argv)
+
+
+# 'bokeh serve' chạy file này với __name__ dạng 'bokeh_app_<...>'
+if __name__.startswith('bokeh_app'):
+    args = parse_args(sys.argv[1:])
+    history = None
+    if args.fake:
+        feed = fake_feed()
+        history = load_history(args.history, ticker=args.ticker)
+        if history is None or history.empty:
+            history = fake_history(args.ticker)
+    else:
+        feed = history_feed(args.history)
+
+    make_live_document(curdoc(), args.ticker, feed,
+                       history=history,
+                       interval_seconds=args.interval,
+                       rollover=args.rollover,
+                       history_dir=args.history)
@@ -1,9 +1,13 @@
-import yfinance as yf
 import pandas as pd
 import os
 from yahoo_charts import create_commodity_charts
 from sunsirs_charts import create_excel_with_charts
 from cloud_helpers import push_to_github, authenticate, upload_or_update_file
+from price_store import save_history, save_ticker_history, load_history
+from indicators import load_or_compute_indicators
+from yahoo_data import fetch_all_with_fallback, iter_fetch_with_fallback
+from fetch_guard import CircuitBreaker, Deadline
+from resampling import to_resolution
 
 comodity = ['HRC=F', # Hot Rolled Coil
         'CL=F',  # Crude Oil (WTI)
@@ -21,20 +25,74 @@ comodity = ['HRC=F', # Hot Rolled Coil
         ]
 
 period = '2y'
-part = []
-for i in comodity:
-    get = yf.Ticker(i)
-    a = get.history(period=period)
-    a.index.name = 'date'
-    prices = a['Close']
-    a['name'] = i
-    part.append(a)
 
-df = pd.concat(part)  
+# Hợp đồng năng lượng lấy dữ liệu intraday ('1h' hoặc '15m'); còn lại dùng bar ngày.
+# Lưu bar ở độ phân giải nhỏ nhất, các khung ngày/tuần/tháng được resample khi cần (resampling.py)
+INTRADAY_INTERVALS = {
+    'CL=F': '1h',
+    'BZ=F': '1h',
+    'NG=F': '1h',
+    'RB=F': '1h',
+    'HO=F': '1h',
+}
+
+# Giới hạn thời gian: mỗi request và cả bước tải dữ liệu (giây)
+YAHOO_REQUEST_TIMEOUT = 30
+YAHOO_STAGE_DEADLINE = 300
+SUNSIRS_STAGE_DEADLINE = 300
+
+# STREAMING: từng ticker đi thẳng fetch -> returns -> chart -> ghi Excel (bộ nhớ đỉnh ~ 1 ticker,
+# chart đầu tiên có ngay khi ticker đầu tiên tải xong). Tắt: tải hết rồi mới vẽ (có cache chỉ báo).
+STREAMING_MODE = False
+
+# Ticker tải lỗi -> dùng lại dữ liệu lần chạy trước (đánh dấu STALE trong file Excel)
+stale_tickers = {}
+
+def fetch_yahoo_daily():
+    """
+    Tải lịch sử tất cả tickers (có fallback cache) và lưu local.
+    Trả về (bar ngày cho báo cáo, dict các ticker STALE).
+    """
+    try:
+        cached_history = load_history()
+    except Exception as e:
+        # Cache hỏng không được chặn việc tải dữ liệu mới
+        print(f"  CẢNH BÁO: Không đọc được lịch sử đã lưu ({e}). Tải không có fallback cache.")
+        cached_history = None
+
+    history, stale = fetch_all_with_fallback(comodity,
+                                             period=period,
+                                             intervals=INTRADAY_INTERVALS,
+                                             cached_history=cached_history,
+                                             breaker=CircuitBreaker('Yahoo Finance'),
+                                             deadline=Deadline(YAHOO_STAGE_DEADLINE),
+                                             request_timeout=YAHOO_REQUEST_TIMEOUT)
+
+    # Lưu lịch sử giá local (độ phân giải nhỏ nhất; dùng cho live_charts.py - Bokeh server)
+    save_history(history)
+
+    # Báo cáo Excel/HTML dùng bar ngày
+    return to_resolution(history, '1d'), stale
+
+def iter_yahoo_records():
+    """Generator cho chế độ STREAMING: tải từng ticker, lưu lịch sử ngay rồi chuyển tiếp để vẽ"""
+    for ticker, frame in iter_fetch_with_fallback(comodity,
+                                                  period=period,
+                                                  intervals=INTRADAY_INTERVALS,
+                                                  load_cached=lambda t: load_history(ticker=t),
+                                                  breaker=CircuitBreaker('Yahoo Finance'),
+                                                  deadline=Deadline(YAHOO_STAGE_DEADLINE),
+                                                  request_timeout=YAHOO_REQUEST_TIMEOUT,
+                                                  stale=stale_tickers):
+        save_ticker_history(frame, ticker)
+        yield ticker, frame
 
 
 UPLOAD_FILES = True
 
+# Chart trong commodity_charts.xlsx: 'native' (LineChart gốc của Excel, file nhỏ) hoặc 'image' (ảnh PNG matplotlib)
+EXCEL_CHART_MODE = 'native'
+
 # --- Cấu hình Google Drive ---
 ROOT_FOLDER_ID = '1tAeJoC2BiHTV_mTC0KU11ngP7rdcBV-M'
 
@@ -58,76 +116,126 @@ LOCAL_HTML_FOLDER = 'charts_html_local'
 # -----------------------------------------------------------------
 
 
+# Mỗi bước được cô lập: lỗi ở 1 bước không làm hỏng các bước còn lại
+failed_stages = []
+
+def report_stage_error(stage_name, e):
+    failed_stages.append(stage_name)
+    print(f"LỖI ở bước '{stage_name}': {e}")
+    import traceback
+    traceback.print_exc()
+
+# --- BƯỚC 1: TẠO FILE YAHOO ---
 try:
-    # --- BƯỚC 1: TẠO FILE YAHOO ---
     print("\n--- BƯỚC 1: Bắt đầu tạo file Yahoo Finance ---")
     
+    if STREAMING_MODE:
+        print("  Chế độ: STREAMING (xử lý từng ticker ngay khi tải xong).")
+        chart_input = iter_yahoo_records()
+        indicators = None # Tính theo từng ticker trong create_commodity_charts (dùng chung cache chỉ báo)
+    else:
+        # Tải dữ liệu nằm TRONG bước này: lỗi (Yahoo sập, không có cache, cache hỏng...) chỉ làm hỏng bước 1
+        df, stale_tickers = fetch_yahoo_daily()
+        chart_input = df
+        # Chỉ báo kỹ thuật: tính 1 lượt cho tất cả tickers (có cache trong thư mục data/)
+        indicators = load_or_compute_indicators(df)
+    
     if UPLOAD_FILES:
         print("  Chế độ: UPLOAD. Sẽ lưu HTML vào repo local và dùng link GitHub.")
-        create_commodity_charts(df, # Giả sử 'df' đã có từ cell trên
+        create_commodity_charts(chart_input, # DataFrame 'df' hoặc generator (STREAMING)
                                 'commodity_charts.xlsx', 
                                 period_years=1,
                                 upload_mode=True, # <-- Bật
                                 github_repo_local_path=HTML_SAVE_PATH,
-                                github_pages_url=GITHUB_PAGES_URL
+                                github_pages_url=GITHUB_PAGES_URL,
+                                indicators=indicators,
+                                chart_mode=EXCEL_CHART_MODE,
+                                stale=stale_tickers
                                )
     else:
         print("  Chế độ: LOCAL. Sẽ lưu HTML vào thư mục local.")
-        create_commodity_charts(df, # Giả sử 'df' đã có
+        create_commodity_charts(chart_input, # DataFrame 'df' hoặc generator (STREAMING)
                                 'commodity_charts.xlsx', 
                                 period_years=1,
                                 upload_mode=False, # <-- Tắt
-                                local_html_folder=LOCAL_HTML_FOLDER
+                                local_html_folder=LOCAL_HTML_FOLDER,
+                                indicators=indicators,
+                                chart_mode=EXCEL_CHART_MODE,
+                                stale=stale_tickers
                                )
-    
-    # --- BƯỚC 2: TẠO FILE SUNSIRS (LOCAL) ---
-    # (Hàm này luôn chạy, vì nó chỉ tạo file local)
+except Exception as e:
+    report_stage_error("Yahoo Finance", e)
+
+# --- BƯỚC 2: TẠO FILE SUNSIRS (LOCAL) ---
+# (Hàm này luôn chạy, vì nó chỉ tạo file local; file chỉ được tạo lại khi có chart thay đổi)
+sunsirs_changed = True
+try:
     print("\n--- BƯỚC 2: Bắt đầu tạo file Sunsirs (local) ---")
     commodities_to_fetch_sunsirs = [
         'Coking coal', 'Fuel Oil', 'Gasoline', 'Diesel', 
         'Hot rolled coil', 'Iron ore'
     ]
-    create_excel_with_charts(commodities_to_fetch_sunsirs, 
-                             output_filename="Sunsirs_Charts.xlsx")
-    
-    # --- BƯỚC 3 & 4: UPLOAD (NẾU ĐƯỢC BẬT) ---
-    if UPLOAD_FILES:
-        # --- BƯỚC 3: PUSH GITHUB ---
+    stale_sunsirs, sunsirs_changed = create_excel_with_charts(commodities_to_fetch_sunsirs, 
+                                                              output_filename="Sunsirs_Charts.xlsx",
+                                                              stage_deadline=SUNSIRS_STAGE_DEADLINE)
+    if stale_sunsirs:
+        print(f"  CẢNH BÁO: {len(stale_sunsirs)} chart Sunsirs dùng ảnh cache (STALE): {', '.join(stale_sunsirs)}")
+except Exception as e:
+    report_stage_error("Sunsirs", e)
+
+# --- BƯỚC 3 & 4: UPLOAD (NẾU ĐƯỢC BẬT) ---
+if UPLOAD_FILES:
+    # --- BƯỚC 3: PUSH GITHUB ---
+    try:
         print("\n--- BƯỚC 3: [UPLOAD=True] Bắt đầu push các file HTML lên GitHub ---")
-        push_to_github(repo_local_path=REPO_LOCAL_PATH,
-                       github_token=GITHUB_TOKEN,
-                       github_username=GITHUB_USERNAME,
-                       github_repo_name=GITHUB_REPO_NAME)
-        
-        # --- BƯỚC 4: UPLOAD GOOGLE DRIVE ---
-        print("\n--- BƯỚC 4: [UPLOAD=True] Bắt đầu upload 2 file Excel lên Google Drive ---")
+        if not push_to_github(repo_local_path=REPO_LOCAL_PATH,
+                              github_token=GITHUB_TOKEN,
+                              github_username=GITHUB_USERNAME,
+                              github_repo_name=GITHUB_REPO_NAME):
+            failed_stages.append("GitHub")
+    except Exception as e:
+        report_stage_error("GitHub", e)
+    
+    # --- BƯỚC 4: UPLOAD GOOGLE DRIVE ---
+    try:
+        print("\n--- BƯỚC 4: [UPLOAD=True] Bắt đầu upload các file Excel lên Google Drive ---")
         
         print("  Đang xác thực Google Drive...")
         drive_service = authenticate()
         print("  Xác thực Google Drive thành công!")
         
         file_list_to_upload = [
-            {"local_path": "commodity_charts.xlsx", "drive_name": "commodity_charts.xlsx"},
-            {"local_path": "Sunsirs_Charts.xlsx", "drive_name": "Sunsirs_Charts.xlsx"}
+            {"local_path": "commodity_charts.xlsx", "drive_name": "commodity_charts.xlsx"}
         ]
+        if sunsirs_changed:
+            file_list_to_upload.append({"local_path": "Sunsirs_Charts.xlsx", "drive_name": "Sunsirs_Charts.xlsx"})
+        else:
+            print("  Sunsirs_Charts.xlsx không thay đổi -> bỏ qua upload.")
 
         for file_info in file_list_to_upload:
             print(f"--- Đang xử lý file Excel: {file_info['local_path']} ---")
-            upload_or_update_file(drive_service, 
-                                  file_info['local_path'], 
-                                  file_info['drive_name'], 
-                                  ROOT_FOLDER_ID 
-                                 )
-        
-        print("\n✅✅✅ HOÀN TẤT TOÀN BỘ QUY TRÌNH (UPLOAD)! ✅✅✅")
-    
-    else:
-        # --- BƯỚC 3 & 4 (BỊ TẮT) ---
-        print("\n--- BƯỚC 3&4: [UPLOAD=False] Bỏ qua bước push GitHub và upload Google Drive.")
-        print("\n✅✅✅ HOÀN TẤT (LOCAL)! ✅✅✅")
-        print(f"Các file Excel và HTML đã được tạo/cập nhật trong thư mục local (thư mục HTML: '{LOCAL_HTML_FOLDER}').")
+            try:
+                upload_or_update_file(drive_service, 
+                                      file_info['local_path'], 
+                                      file_info['drive_name'], 
+                                      ROOT_FOLDER_ID 
+                                     )
+            except Exception as e:
+                report_stage_error(f"Google Drive ({file_info['drive_name']})", e)
+    except Exception as e:
+        report_stage_error("Google Drive", e)
 
-except Exception as e:
-    print(f"ĐÃ XẢY RA LỖI NGHIÊM TRỌNG: {e}")
-    import traceback
-    traceback.print_exc()
\ No newline at end of file
+else:
+    # --- BƯỚC 3 & 4 (BỊ TẮT) ---
+    print("\n--- BƯỚC 3&4: [UPLOAD=False] Bỏ qua bước push GitHub và upload Google Drive.")
+
+# --- TỔNG KẾT ---
+if stale_tickers:
+    print(f"\nCẢNH BÁO: {len(stale_tickers)} ticker Yahoo dùng dữ liệu cache (STALE): {', '.join(stale_tickers)}")
+if failed_stages:
+    print(f"\n⚠️ HOÀN TẤT NHƯNG CÓ LỖI ở các bước: {', '.join(failed_stages)}")
+elif UPLOAD_FILES:
+    print("\n✅✅✅ HOÀN TẤT TOÀN BỘ QUY TRÌNH (UPLOAD)! ✅✅✅")
+else:
+    print("\n✅✅✅ HOÀN TẤT (LOCAL)! ✅✅✅")
+    print(f"Các file Excel và HTML đã được tạo/cập nhật trong thư mục local (thư mục HTML: '{LOCAL_HTML_FOLDER}').")
\ No newline at end of file
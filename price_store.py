@@ -0,0 +1,96 @@
+import os
+import glob
+import json
+import pandas as pd
+
+
+# Thư mục lưu lịch sử giá: MỖI ticker 1 file (dạng long: index 'date', cột OHLCV + 'name')
+# -> có thể ghi/đọc từng ticker riêng (pipeline streaming, live server) mà không phải nạp cả universe
+HISTORY_DIR = os.path.join('data', 'prices')
+
+
+# File chỉ mục {tên file: ticker} trong thư mục lịch sử -> liệt kê ticker mà không cần đọc pickle
+TICKER_INDEX_FILE = 'tickers.json'
+
+
+def history_file(ticker, history_dir=HISTORY_DIR):
+    """Đường dẫn file lịch sử của 1 ticker (vd: 'CL=F' -> data/prices/CL_F.pkl)"""
+    return os.path.join(history_dir, f"{ticker.replace('=', '_')}.pkl")
+
+
+def save_ticker_history(frame, ticker=None, history_dir=HISTORY_DIR):
+    """
+    Lưu lịch sử giá của 1 ticker.
+    Ghi ra file tạm rồi đổi tên để người đọc (vd: live server) không đọc phải file ghi dở.
+    """
+    if ticker is None:
+        ticker = frame['name'].iloc[0]
+    os.makedirs(history_dir, exist_ok=True)
+
+    path = history_file(ticker, history_dir)
+    tmp_path = f"{path}.tmp"
+    frame.to_pickle(tmp_path)
+    os.replace(tmp_path, path)
+
+    index = _read_ticker_index(history_dir)
+    if index.get(os.path.basename(path)) != ticker:
+        index[os.path.basename(path)] = ticker
+        index_path = os.path.join(history_dir, TICKER_INDEX_FILE)
+        with open(f"{index_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(f"{index_path}.tmp", index_path)
+    return path
+
+
+def _read_ticker_index(history_dir):
+    try:
+        with open(os.path.join(history_dir, TICKER_INDEX_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def list_tickers(history_dir=HISTORY_DIR):
+    """
+    Danh sách ticker đã lưu trong 'history_dir' (theo thứ tự chữ cái), đọc từ file chỉ mục.
+    File chưa có trong chỉ mục (dữ liệu cũ) -> đọc cột 'name' của file đó (không giữ lại DataFrame).
+    """
+    index = _read_ticker_index(history_dir)
+    tickers = []
+    for path in sorted(glob.glob(os.path.join(history_dir, '*.pkl'))):
+        ticker = index.get(os.path.basename(path))
+        if ticker is None:
+            ticker = pd.read_pickle(path)['name'].iloc[0]
+        tickers.append(ticker)
+    return sorted(tickers)
+
+
+def save_history(df, history_dir=HISTORY_DIR):
+    """Lưu DataFrame lịch sử giá (tất cả tickers) xuống thư mục local, mỗi ticker 1 file."""
+    if 'date' in df.columns:
+        df = df.set_index('date')
+
+    for ticker, frame in df.groupby('name', sort=False):
+        save_ticker_history(frame, ticker, history_dir)
+    print(f"  Đã lưu lịch sử giá ({len(df)} dòng) vào: {history_dir}")
+    return history_dir
+
+
+def load_history(history_dir=HISTORY_DIR, ticker=None):
+    """
+    Đọc lịch sử giá đã lưu. Trả về None nếu chưa có dữ liệu.
+    Nếu truyền 'ticker' thì chỉ đọc file của ticker đó (đã sort theo ngày).
+    """
+    if ticker is not None:
+        paths = [history_file(ticker, history_dir)]
+    else:
+        paths = sorted(glob.glob(os.path.join(history_dir, '*.pkl')))
+    paths = [path for path in paths if os.path.exists(path)]
+    if not paths:
+        return None
+
+    df = pd.concat([pd.read_pickle(path) for path in paths])
+    if 'date' in df.columns:
+        df = df.set_index('date')
+
+    return df.sort_index() if ticker is not None else df
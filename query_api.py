@@ -0,0 +1,268 @@
+"""
+API tra cứu giá / returns / thống kê từ dữ liệu pipeline đã lưu (price_store), không cần chạy lại
+pipeline hay đọc file Excel.
+
+Python:
+    from query_api import PriceQuery
+    q = PriceQuery()
+    q.returns('CL=F', start='2025-01-01', end='2025-06-30')
+
+HTTP/JSON (local):
+    python query_api.py --port 8050
+    GET /tickers
+    GET /prices?ticker=CL=F&start=2025-01-01&end=2025-06-30
+    GET /returns?ticker=CL=F&start=2025-01-01
+    GET /stats?ticker=GC=F&start=2025-01-01&end=2025-12-31
+"""
+import argparse
+import json
+import math
+import os
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+from price_store import HISTORY_DIR, history_file, list_tickers
+from resampling import to_resolution
+from yahoo_charts import calculate_returns
+
+
+DEFAULT_PORT = 8050
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_FRAME_CACHE_SIZE = 16  # Số bảng giá (1 ticker / 1 phiên bản file) giữ trong bộ nhớ
+
+
+def parse_date(value):
+    """Chuỗi ngày từ người dùng -> pd.Timestamp (None nếu bỏ trống). Sai định dạng -> ValueError"""
+    if value is None or value == '':
+        return None
+    try:
+        return pd.Timestamp(value)
+    except (ValueError, TypeError):
+        raise ValueError(f"Ngày không hợp lệ: '{value}' (định dạng YYYY-MM-DD)")
+
+
+def slice_dates(frame, start=None, end=None):
+    """
+    Lọc các dòng trong khoảng [start, end] bằng tìm kiếm nhị phân trên index đã sort.
+    'end' chỉ có ngày (00:00) -> lấy hết ngày đó.
+    """
+    index = frame.index
+    tz = getattr(index, 'tz', None)
+
+    def align(ts):
+        if tz is not None and ts.tz is None:
+            return ts.tz_localize(tz)
+        if tz is None and ts.tz is not None:
+            return ts.tz_localize(None)
+        return ts
+
+    first = 0 if start is None else index.searchsorted(align(start), side='left')
+    if end is None:
+        last = len(index)
+    elif end == end.normalize():
+        last = index.searchsorted(align(end + pd.Timedelta(days=1)), side='left')
+    else:
+        last = index.searchsorted(align(end), side='right')
+    return frame.iloc[first:last]
+
+
+class PriceQuery:
+    """
+    Tra cứu dữ liệu đã lưu. Mỗi ticker được nạp thành bảng index theo ngày (sort sẵn -> lọc
+    khoảng ngày bằng tìm kiếm nhị phân); bảng giá và kết quả tính toán đều nằm trong LRU cache có giới hạn.
+    Cache tự hết hạn khi file lịch sử của ticker thay đổi (mtime) sau mỗi lần pipeline chạy.
+
+    'ticker' chỉ được chấp nhận nếu khớp với 1 file trong 'history_dir' -> tham số từ người dùng
+    không bao giờ được ghép thẳng thành đường dẫn để đọc pickle.
+    """
+
+    def __init__(self, history_dir=HISTORY_DIR, resolution='1d', cache_size=DEFAULT_CACHE_SIZE,
+                 frame_cache_size=DEFAULT_FRAME_CACHE_SIZE):
+        self.history_dir = history_dir
+        self.resolution = resolution
+        # LRU cache theo từng instance; 'version' (đường dẫn, mtime) nằm trong key nên dữ liệu mới
+        # không dính cache cũ, phiên bản cũ tự bị đẩy ra. Bảng giá cũng nằm trong LRU (có giới hạn).
+        self._load = lru_cache(maxsize=frame_cache_size)(self._read_frame)
+        self._cached_returns = lru_cache(maxsize=cache_size)(self._compute_returns)
+        self._cached_stats = lru_cache(maxsize=cache_size)(self._compute_stats)
+
+    # --- Nạp dữ liệu ---
+    def _stored_files(self):
+        """{đường dẫn: mtime} của các file lịch sử hiện có trong 'history_dir'"""
+        try:
+            names = os.listdir(self.history_dir)
+        except FileNotFoundError:
+            return {}
+        paths = [os.path.join(self.history_dir, name) for name in names if name.endswith('.pkl')]
+        return {path: os.stat(path).st_mtime_ns for path in paths if os.path.isfile(path)}
+
+    def _read_frame(self, path, mtime):
+        """Đọc 1 file lịch sử và đưa về độ phân giải 'resolution' (được cache theo (path, mtime))"""
+        frame = pd.read_pickle(path)
+        if 'date' in frame.columns:
+            frame = frame.set_index('date')
+        return to_resolution(frame.sort_index(), self.resolution).sort_index()
+
+    def tickers(self):
+        """Danh sách ticker đã lưu (đọc từ chỉ mục của price_store, không nạp dữ liệu giá)"""
+        return list_tickers(self.history_dir)
+
+    def _version(self, ticker):
+        # Chỉ nhận ticker có file tương ứng trong thư mục lịch sử (chặn '../', đường dẫn tuyệt đối...)
+        path = history_file(ticker, self.history_dir)
+        version = self._stored_files().get(path)
+        if version is None:
+            raise KeyError(f"Không có dữ liệu cho ticker '{ticker}'")
+        return path, version
+
+    def _frame(self, ticker, version):
+        return self._load(*version)
+
+    # --- Tính toán (được cache) ---
+    def _compute_prices(self, ticker, start, end, version):
+        return slice_dates(self._frame(ticker, version), start, end)
+
+    def _compute_returns(self, ticker, start, end, version):
+        # Tính trên toàn bộ lịch sử rồi mới cắt khoảng ngày (cần dữ liệu trước 'start' cho Weekly/YoY...)
+        returns = calculate_returns(self._frame(ticker, version)['Close'])
+        return slice_dates(returns, start, end)
+
+    def _compute_stats(self, ticker, start, end, version):
+        close = self._compute_prices(ticker, start, end, version)['Close'].dropna()
+        if close.empty:
+            return {'ticker': ticker,
+                    'start': start.strftime('%Y-%m-%d') if start is not None else None,
+                    'end': end.strftime('%Y-%m-%d') if end is not None else None,
+                    'count': 0}
+
+        daily = close.pct_change().dropna()
+        drawdown = close / close.cummax() - 1
+        return {
+            'ticker': ticker,
+            'start': close.index[0].strftime('%Y-%m-%d'),
+            'end': close.index[-1].strftime('%Y-%m-%d'),
+            'count': int(len(close)),
+            'first': float(close.iloc[0]),
+            'last': float(close.iloc[-1]),
+            'change_pct': float((close.iloc[-1] / close.iloc[0] - 1) * 100),
+            'min': float(close.min()),
+            'max': float(close.max()),
+            'mean': float(close.mean()),
+            'volatility_pct': float(daily.std() * np.sqrt(252) * 100) if len(daily) > 1 else None,
+            'max_drawdown_pct': float(drawdown.min() * 100),
+        }
+
+    # --- API công khai ---
+    def prices(self, ticker, start=None, end=None):
+        """Giá OHLCV của ticker trong khoảng [start, end] (chuỗi 'YYYY-MM-DD' hoặc None)"""
+        start, end = parse_date(start), parse_date(end)
+        return self._compute_prices(ticker, start, end, self._version(ticker)).copy()
+
+    def returns(self, ticker, start=None, end=None):
+        """Close + Daily/Weekly/Monthly/YoY/YTD % (giống calculate_returns) trong khoảng [start, end]"""
+        start, end = parse_date(start), parse_date(end)
+        return self._cached_returns(ticker, start, end, self._version(ticker)).copy()
+
+    def stats(self, ticker, start=None, end=None):
+        """Thống kê tóm tắt giá Close trong khoảng [start, end]"""
+        start, end = parse_date(start), parse_date(end)
+        return dict(self._cached_stats(ticker, start, end, self._version(ticker)))
+
+    def cache_info(self):
+        return {'frames': self._load.cache_info()._asdict(),
+                'returns': self._cached_returns.cache_info()._asdict(),
+                'stats': self._cached_stats.cache_info()._asdict()}
+
+
+def frame_to_records(frame):
+    """DataFrame (index ngày) -> list dict để trả JSON (NaN -> null)"""
+    records = []
+    for date, row in zip(frame.index, frame.to_dict('records')):
+        record = {'date': date.strftime('%Y-%m-%d %H:%M') if (date.hour or date.minute) else date.strftime('%Y-%m-%d')}
+        for key, value in row.items():
+            if isinstance(value, float) and math.isnan(value):
+                value = None
+            record[key] = value
+        records.append(record)
+    return records
+
+
+def make_handler(query):
+    """Tạo class handler HTTP dùng chung 1 đối tượng PriceQuery (và cache của nó)"""
+
+    class QueryHandler(BaseHTTPRequestHandler):
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            route = url.path.rstrip('/')
+
+            try:
+                if route == '/tickers':
+                    return self._send_json(200, {'tickers': query.tickers()})
+
+                if route not in ('/prices', '/returns', '/stats'):
+                    return self._send_json(404, {'error': f"Không có endpoint '{url.path}'"})
+
+                ticker = params.get('ticker')
+                if not ticker:
+                    return self._send_json(400, {'error': "Thiếu tham số 'ticker'"})
+                start, end = params.get('start'), params.get('end')
+
+                if route == '/stats':
+                    return self._send_json(200, query.stats(ticker, start, end))
+
+                frame = query.prices(ticker, start, end) if route == '/prices' else query.returns(ticker, start, end)
+                if 'name' in frame.columns:
+                    frame = frame.drop(columns='name')
+                return self._send_json(200, {'ticker': ticker, 'data': frame_to_records(frame)})
+
+            except KeyError as e:
+                return self._send_json(404, {'error': e.args[0] if e.args else str(e)})
+            except ValueError as e:
+                return self._send_json(400, {'error': str(e)})
+            except Exception as e:
+                return self._send_json(500, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            print(f"  [query_api] {self.address_string()} - {format % args}")
+
+    return QueryHandler
+
+
+def serve(host='127.0.0.1', port=DEFAULT_PORT, history_dir=HISTORY_DIR, cache_size=DEFAULT_CACHE_SIZE,
+          frame_cache_size=DEFAULT_FRAME_CACHE_SIZE):
+    """Chạy HTTP/JSON server local (chặn cho tới khi Ctrl+C)"""
+    query = PriceQuery(history_dir=history_dir, cache_size=cache_size, frame_cache_size=frame_cache_size)
+    server = ThreadingHTTPServer((host, port), make_handler(query))
+    print(f"Query API đang chạy tại http://{host}:{port}/ (dữ liệu: '{history_dir}')")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nĐang dừng Query API...")
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="HTTP/JSON API tra cứu giá, returns và thống kê đã lưu")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--history', default=HISTORY_DIR, help="Thư mục lịch sử giá local")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE, help="Số kết quả tối đa trong LRU cache")
+    parser.add_argument('--frame-cache-size', type=int, default=DEFAULT_FRAME_CACHE_SIZE,
+                        help="Số bảng giá tối đa giữ trong bộ nhớ")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.history, args.cache_size, args.frame_cache_size)
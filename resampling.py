@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+
+
+# Các độ phân giải hỗ trợ -> offset dùng cho resample
+RESOLUTION_OFFSETS = {
+    '15m': pd.offsets.Minute(15),
+    '1h': pd.offsets.Hour(1),
+    '1d': pd.offsets.Day(1),
+    '1wk': pd.offsets.Week(weekday=4),  # Tuần kết thúc vào thứ 6
+    '1mo': pd.offsets.MonthEnd(),
+}
+
+# Độ dài (xấp xỉ) của 1 bar, dùng để so sánh độ phân giải
+RESOLUTION_LENGTHS = {
+    '15m': pd.Timedelta(minutes=15),
+    '1h': pd.Timedelta(hours=1),
+    '1d': pd.Timedelta(days=1),
+    '1wk': pd.Timedelta(weeks=1),
+    '1mo': pd.Timedelta(days=30),
+}
+
+# (Khoảng thời gian tối đa hiển thị, độ phân giải phù hợp) - xét từ trên xuống
+PERIOD_RESOLUTIONS = [
+    (pd.Timedelta(days=5), '15m'),
+    (pd.Timedelta(days=60), '1h'),
+    (pd.Timedelta(days=3 * 365), '1d'),
+    (pd.Timedelta(days=10 * 365), '1wk'),
+]
+
+# Phiên Globex (CL/BZ/NG/RB/HO...) chạy 18:00 -> 17:00 giờ sàn (ET): bar từ 18:00 trở đi
+# thuộc phiên của NGÀY HÔM SAU. Bar ngày được gắn nhãn theo ngày KẾT THÚC phiên (giống bar ngày của Yahoo)
+SESSION_START_HOUR = 18
+
+OHLCV_AGG = {
+    'Open': 'first',
+    'High': 'max',
+    'Low': 'min',
+    'Close': 'last',
+    'Volume': 'sum',
+}
+
+
+def resolution_for_period(period):
+    """Chọn độ phân giải phù hợp để vẽ một khoảng thời gian 'period' (Timedelta)"""
+    for max_period, resolution in PERIOD_RESOLUTIONS:
+        if period <= max_period:
+            return resolution
+    return '1mo'
+
+
+def infer_bar_lengths(df):
+    """
+    Ước lượng độ dài bar của từng ticker (trung vị khoảng cách giữa 2 bar liên tiếp).
+    Vectorized: 1 lượt groupby trên toàn bộ DataFrame dạng long.
+    """
+    data = df[['name']].rename_axis('date').reset_index().sort_values(['name', 'date'], kind='stable')
+    gaps = data.groupby('name', sort=False)['date'].diff()
+    return gaps.groupby(data['name']).median()
+
+
+def session_dates(index, start_hour=SESSION_START_HOUR):
+    """
+    Ngày phiên giao dịch (ngày kết thúc phiên, lúc 00:00) của từng mốc thời gian trong 'index'.
+    Tính theo giờ địa phương của index (Yahoo trả về giờ của sàn) để không lệch khi đổi DST.
+    """
+    tz = getattr(index, 'tz', None)
+    wall_time = index.tz_localize(None) if tz is not None else index
+    dates = (wall_time + pd.Timedelta(hours=24 - start_hour)).normalize()
+    return dates.tz_localize(tz) if tz is not None else dates
+
+
+def resample_ohlc(df, resolution):
+    """
+    Gộp bar (OHLCV) của TẤT CẢ tickers lên độ phân giải 'resolution' ('1d', '1wk', ...).
+    Vectorized: groupby theo (name, mốc thời gian) rồi agg, không lặp theo ticker.
+    Input/Output: DataFrame dạng long (index 'date', cột OHLCV + 'name').
+    """
+    if 'date' in df.columns:
+        df = df.set_index('date')
+    df = df.rename_axis('date')
+
+    agg = {col: how for col, how in OHLCV_AGG.items() if col in df.columns}
+    if resolution == '1d':
+        # Bar ngày theo PHIÊN giao dịch (18:00 -> 17:00), không theo nửa đêm -> không sinh bar Chủ nhật
+        grouper = pd.Index(session_dates(df.index), name='date')
+    else:
+        grouper = pd.Grouper(level='date', freq=RESOLUTION_OFFSETS[resolution])
+    out = df.groupby(['name', grouper]).agg(agg)
+
+    # Bỏ các bin rỗng (cuối tuần, ngày nghỉ...)
+    out = out.dropna(subset=['Close'])
+    return out.reset_index(level='name')
+
+
+def to_resolution(df, resolution):
+    """
+    Đưa dữ liệu về độ phân giải 'resolution'. Chỉ resample các ticker có bar MỊN HƠN
+    độ phân giải đích; ticker đã đủ thô (vd: bar ngày khi cần '1d') giữ nguyên.
+    Thứ tự ticker trong output giống input.
+    """
+    if 'date' in df.columns:
+        df = df.set_index('date')
+
+    bar_lengths = infer_bar_lengths(df)
+    # Dùng 90% độ dài đích để không resample nhầm bar ngày bị lệch giờ (DST, ...)
+    finer = bar_lengths.index[bar_lengths < RESOLUTION_LENGTHS[resolution] * 0.9]
+    if len(finer) == 0:
+        return df
+
+    is_finer = df['name'].isin(finer)
+    resampled = resample_ohlc(df[is_finer], resolution)
+
+    # Giữ thứ tự ticker như input (thứ tự cấu hình), trong mỗi ticker sort theo thời gian
+    order = {name: i for i, name in enumerate(pd.unique(df['name']))}
+    out = pd.concat([df[~is_finer], resampled]).rename_axis('date')
+    out = out.assign(_order=out['name'].map(order))
+    return out.sort_values(['_order', 'date'], kind='stable').drop(columns='_order')
+
+
+def price_as_of(close, when, inclusive=True):
+    """
+    Giá Close gần nhất TẠI hoặc TRƯỚC mỗi mốc trong 'when' (vectorized bằng searchsorted).
+    inclusive=False -> chỉ lấy giá TRƯỚC hẳn mốc đó.
+    'close' phải sort theo thời gian. Trả về NaN nếu không có giá nào trước mốc đó.
+    """
+    if len(close) == 0:
+        return np.full(len(when), np.nan)
+    pos = close.index.searchsorted(when, side='right' if inclusive else 'left') - 1
+    values = close.to_numpy(dtype=float)[np.clip(pos, 0, None)]
+    values[pos < 0] = np.nan
+    return values
@@ -10,18 +10,38 @@ from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.options import Options
 import io
+import os
+import json
 import time
+import datetime
+import hashlib
+import threading
+from urllib.parse import urljoin
+from fetch_guard import CircuitBreaker, Deadline, run_with_timeout
+
+
+# Cache ảnh chart đã chụp lần gần nhất (dùng lại khi Sunsirs lỗi) + bản đồ Tên -> ID
+SUNSIRS_CACHE_DIR = os.path.join('data', 'sunsirs_cache')
+# Manifest trong thư mục cache: trạng thái ảnh chart lần trước (URL, ETag, Last-Modified, sha256)
+# + chữ ký của file Excel đã tạo -> phát hiện chart nào thay đổi mà không cần mở Selenium
+MANIFEST_FILE = 'manifest.json'
+
+REQUEST_TIMEOUT = 30    # Timeout mỗi request HTTP (giây)
+PAGE_LOAD_TIMEOUT = 30  # Timeout tải trang trong Selenium (giây)
+DRIVER_START_TIMEOUT = 120  # Timeout tải ChromeDriver + khởi động Chrome (giây)
+STAGE_DEADLINE = 300    # Thời gian tối đa cho cả bước Sunsirs (giây)
 
 
 # --- BƯỚC 1: Xây dựng bản đồ (map) Tên Commodity -> ID (Giữ nguyên) ---
-def get_commodity_map():
+def get_commodity_map(request_timeout=REQUEST_TIMEOUT, cache_dir=SUNSIRS_CACHE_DIR):
     base_url = "https://www.sunsirs.com/uk/"
     page_url = f"{base_url}sectors.html"
     commodity_map = {}
+    cache_path = os.path.join(cache_dir, 'commodity_map.json')
     
     print(f"Đang tải trang danh mục từ {page_url}...")
     try:
-        r = requests.get(page_url, headers={'User-Agent': 'Mozilla/5.0'})
+        r = requests.get(page_url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=request_timeout)
         r.raise_for_status()
         soup = BeautifulSoup(r.text, 'html.parser')
         
@@ -41,28 +61,80 @@ def get_commodity_map():
                             commodity_map[name] = commodity_id
                             
         print(f"Tìm thấy {len(commodity_map)} commodities.")
+        if commodity_map:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump(commodity_map, f, ensure_ascii=False)
         return commodity_map
         
     except Exception as e:
         print(f"LỖI: Không thể lấy dữ liệu commodities: {e}")
+        # Dùng lại bản đồ đã lưu lần trước (nếu có)
+        if os.path.exists(cache_path):
+            print(f"  Dùng bản đồ commodities đã lưu: {cache_path}")
+            with open(cache_path, encoding='utf-8') as f:
+                return json.load(f)
         return None
 
-# --- BƯỚC 2 & 3 (Thay đổi hoàn toàn) ---
-def create_excel_with_charts(commodity_names_list, output_filename='commodity_charts.xlsx'):
+def load_manifest(cache_dir=SUNSIRS_CACHE_DIR):
+    """Đọc manifest cache. Chưa có / hỏng -> manifest rỗng (coi như mọi chart đều thay đổi)"""
+    path = os.path.join(cache_dir, MANIFEST_FILE)
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    manifest.setdefault('charts', {})
+    return manifest
+
+def save_manifest(manifest, cache_dir=SUNSIRS_CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, MANIFEST_FILE)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+def check_chart_update(commodity_id, entry, request_timeout=REQUEST_TIMEOUT):
     """
-    Hàm chính: Dùng Selenium, screenshot chart,
-    CĂN GIỮA TIÊU ĐỀ và LÙI LỀ ẢNH.
+    Kiểm tra chart có thay đổi so với lần chụp trước hay không, chỉ bằng HTTP (không cần Selenium):
+    lấy URL ảnh chart trên trang chi tiết rồi gửi GET có điều kiện (If-None-Match / If-Modified-Since).
+    304 hoặc nội dung ảnh có cùng sha256 -> không đổi.
+    Trả về (changed, info) với info = {'url', 'etag', 'last_modified', 'sha256'} mới nhất.
     """
-    print("Bắt đầu xây dựng bản đồ Tên -> ID...")
-    commodity_map = get_commodity_map()
-    
-    if not commodity_map:
-        print("Không thể xây dựng bản đồ. Thoát.")
-        return
+    headers = {'User-Agent': 'Mozilla/5.0'}
+    page_url = f"https://www.sunsirs.com/uk/prodetail-{commodity_id}.html"
+    r = requests.get(page_url, headers=headers, timeout=request_timeout)
+    r.raise_for_status()
+    img = BeautifulSoup(r.text, 'html.parser').find('img', src=lambda src: src and 'graph.100ppi.com' in src)
+    if img is None:
+        raise ValueError("không tìm thấy ảnh chart trên trang chi tiết")
+    image_url = urljoin(page_url, img['src'])
 
-    # --- Cấu hình Selenium ---
+    # URL ảnh khác lần trước -> không gửi điều kiện, tải ảnh mới để so sánh hash
+    if image_url == entry.get('url'):
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    r = requests.get(image_url, headers={**headers, 'Referer': page_url}, timeout=request_timeout)
+    if r.status_code == 304:
+        return False, dict(entry)
+    r.raise_for_status()
+
+    info = {
+        'url': image_url,
+        'etag': r.headers.get('ETag'),
+        'last_modified': r.headers.get('Last-Modified'),
+        'sha256': hashlib.sha256(r.content).hexdigest(),
+    }
+    return info['sha256'] != entry.get('sha256'), info
+
+def start_driver(abandoned=None):
+    """
+    Khởi động trình duyệt ảo (Headless Chrome).
+    'abandoned' (threading.Event) được set khi bên gọi đã hết thời gian chờ -> đóng ngay Chrome vừa mở.
+    """
     print("Đang khởi động trình duyệt ảo (Headless Chrome)...")
-    # ... (Toàn bộ code Selenium giữ nguyên y hệt) ...
     chrome_options = Options()
     chrome_options.add_argument("--headless")
     chrome_options.add_argument("--window-size=1920,1080")
@@ -70,9 +142,42 @@ def create_excel_with_charts(commodity_names_list, output_filename='commodity_ch
     chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/5.37.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/5.37.36")
     s = Service(ChromeDriverManager().install())
     driver = webdriver.Chrome(service=s, options=chrome_options)
+    if abandoned is not None and abandoned.is_set():
+        # Không để Chrome chạy mồ côi khi bên gọi đã bỏ cuộc
+        driver.quit()
+        raise TimeoutError("khởi động trình duyệt ảo quá lâu")
     print("Trình duyệt ảo đã sẵn sàng.")
-    # --------------------------
+    return driver
 
+def start_driver_within(deadline, timeout=DRIVER_START_TIMEOUT):
+    """
+    start_driver() có giới hạn thời gian (tải ChromeDriver qua mạng + mở Chrome),
+    không vượt quá thời gian còn lại của cả bước.
+    """
+    if deadline.expired():
+        raise TimeoutError(f"hết thời gian cho phép của bước Sunsirs ({deadline.seconds:.0f}s)")
+    abandoned = threading.Event()
+    try:
+        return run_with_timeout(start_driver, max(1, min(timeout, deadline.remaining())), abandoned)
+    except TimeoutError:
+        abandoned.set()
+        raise
+
+def capture_chart_image(driver, commodity_id):
+    """Mở trang chi tiết commodity và chụp ảnh chart (PNG bytes)"""
+    page_url = f"https://www.sunsirs.com/uk/prodetail-{commodity_id}.html"
+    driver.get(page_url)
+    time.sleep(2)
+    img_xpath = "//img[contains(@src, 'graph.100ppi.com')]"
+    img_element = driver.find_element(By.XPATH, img_xpath)
+    return img_element.screenshot_as_png
+
+# --- BƯỚC 2 & 3 (Thay đổi hoàn toàn) ---
+def write_charts_workbook(charts, stale, output_filename):
+    """
+    Tạo file Excel từ danh sách (tên commodity, ảnh PNG bytes):
+    CĂN GIỮA TIÊU ĐỀ và LÙI LỀ ẢNH. Ảnh STALE được đánh dấu trên tiêu đề.
+    """
     wb = openpyxl.Workbook()
     ws = wb.active
     ws.title = "Commodity Charts"
@@ -83,71 +188,170 @@ def create_excel_with_charts(commodity_names_list, output_filename='commodity_ch
     original_width = 550
     original_height = 332
     
-    for name_input in commodity_names_list:
-        found_name = None
-        commodity_id = None
-        # ... (Vòng lặp tìm commodity_id giữ nguyên) ...
-        for map_name, map_id in commodity_map.items():
-            if map_name.lower() == name_input.lower():
-                found_name = map_name
-                commodity_id = map_id
-                break
+    for found_name, image_data in charts:
+        # 4. Chèn vào Excel (ĐÃ CẬP NHẬT)
+        img_file_in_memory = io.BytesIO(image_data)
         
-        if not commodity_id:
-            print(f"CẢNH BÁO: Không tìm thấy commodity có tên '{name_input}'. Bỏ qua.")
-            continue
-            
-        print(f"Đang xử lý '{found_name}' (ID: {commodity_id})...")
+        # --- PHẦN CĂN GIỮA TIÊU ĐỀ ---
+        # Gộp 11 cột (A đến W)
+        title_cell_start = f'A{current_row}'
+        title_cell_end = f'W{current_row}' # Gộp A -> W
+        ws.merge_cells(f'{title_cell_start}:{title_cell_end}')
+        
+        # Lấy ô đã gộp và set giá trị + căn lề
+        merged_title_cell = ws[title_cell_start] 
+        merged_title_cell.value = found_name
+        merged_title_cell.font = Font(bold=True, size=14)
+        if found_name in stale:
+            # Ảnh cũ (chụp lỗi, dùng cache) -> đánh dấu rõ ràng
+            merged_title_cell.value = f"{found_name}  ⚠ STALE - ảnh cũ, chụp lúc {stale[found_name]:%Y-%m-%d %H:%M}"
+            merged_title_cell.font = Font(bold=True, size=14, color='C0392B')
+        # Đặt căn lề ngang (horizontal) là 'center'
+        merged_title_cell.alignment = Alignment(horizontal='center', vertical='center')
+        ws.row_dimensions[current_row].height = 20 # Tăng chiều cao hàng tiêu đề
+        # --- KẾT THÚC PHẦN TIÊU ĐỀ ---
+
+        # --- PHẦN CĂN GIỮA ẢNH ---
+        img = Image(img_file_in_memory)
+        # Neo ảnh vào cột G (thay vì A) để tạo lề trái
+        img_anchor_cell = f'G{current_row + 1}' 
+        
+        # Scale ảnh
+        img.width = original_width * scale_factor
+        img.height = original_height * scale_factor
+        
+        ws.add_image(img, img_anchor_cell)
+        # --- KẾT THÚC PHẦN ẢNH ---
         
-        try:
-            # 1. & 2. & 3. (Mở trang, tìm
-            # ... (Toàn bộ code Selenium để lấy ảnh giữ nguyên) ...
-            page_url = f"https://www.sunsirs.com/uk/prodetail-{commodity_id}.html"
-            driver.get(page_url)
-            time.sleep(2)
-            img_xpath = "//img[contains(@src, 'graph.100ppi.com')]"
-            img_element = driver.find_element(By.XPATH, img_xpath)
-            image_data = img_element.screenshot_as_png
+        # Tăng số hàng (thêm 1 hàng cho tiêu đề)
+        rows_to_add = int((img.height / 15) + 3) # +3 để chừa chỗ cho tiêu đề
+        current_row += rows_to_add
+           
+    print(f"\nHoàn tất! Đang lưu file vào {output_filename}...")
+    wb.save(output_filename)
+    print("Đã lưu file thành công.")
+
+def create_excel_with_charts(commodity_names_list, output_filename='commodity_charts.xlsx',
+                             cache_dir=SUNSIRS_CACHE_DIR,
+                             request_timeout=REQUEST_TIMEOUT,
+                             page_load_timeout=PAGE_LOAD_TIMEOUT,
+                             stage_deadline=STAGE_DEADLINE):
+    """
+    Hàm chính: kiểm tra từng chart bằng HTTP có điều kiện (xem check_chart_update),
+    chỉ mở Selenium để screenshot các chart ĐÃ THAY ĐỔI; chart không đổi dùng ảnh cache.
+    File Excel chỉ được tạo lại khi có ít nhất 1 ảnh / trạng thái STALE khác lần trước
+    (hoặc file chưa tồn tại).
+    
+    Mỗi lần tải trang bị giới hạn bởi 'page_load_timeout', cả bước bị giới hạn bởi 'stage_deadline'.
+    Commodity nào chụp lỗi -> dùng ảnh đã cache lần trước và đánh dấu STALE trên tiêu đề.
+    Trả về (stale, changed): 'stale' là dict {tên commodity: thời điểm ảnh cache} của các commodity
+    STALE, 'changed' = True nếu file Excel vừa được tạo lại.
+    """
+    deadline = Deadline(stage_deadline)
+    breaker = CircuitBreaker('sunsirs.com')
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = load_manifest(cache_dir)
+    
+    print("Bắt đầu xây dựng bản đồ Tên -> ID...")
+    commodity_map = get_commodity_map(request_timeout=request_timeout, cache_dir=cache_dir)
+    
+    if not commodity_map:
+        print("Không thể xây dựng bản đồ. Thoát.")
+        return {}, False
+
+    # Trình duyệt ảo chỉ được khởi động khi có chart cần chụp lại
+    driver = None
+    driver_error = None
+    
+    charts = []
+    stale = {}
+    
+    try:
+        for name_input in commodity_names_list:
+            found_name = None
+            commodity_id = None
+            # ... (Vòng lặp tìm commodity_id giữ nguyên) ...
+            for map_name, map_id in commodity_map.items():
+                if map_name.lower() == name_input.lower():
+                    found_name = map_name
+                    commodity_id = map_id
+                    break
+        
+            if not commodity_id:
+                print(f"CẢNH BÁO: Không tìm thấy commodity có tên '{name_input}'. Bỏ qua.")
+                continue
             
-            if image_data:
-                # 4. Chèn vào Excel (ĐÃ CẬP NHẬT)
-                img_file_in_memory = io.BytesIO(image_data)
-                
-                # --- PHẦN CĂN GIỮA TIÊU ĐỀ ---
-                # Gộp 11 cột (A đến W)
-                title_cell_start = f'A{current_row}'
-                title_cell_end = f'W{current_row}' # Gộp A -> W
-                ws.merge_cells(f'{title_cell_start}:{title_cell_end}')
-                
-                # Lấy ô đã gộp và set giá trị + căn lề
-                merged_title_cell = ws[title_cell_start] 
-                merged_title_cell.value = found_name
-                merged_title_cell.font = Font(bold=True, size=14)
-                # Đặt căn lề ngang (horizontal) là 'center'
-                merged_title_cell.alignment = Alignment(horizontal='center', vertical='center')
-                ws.row_dimensions[current_row].height = 20 # Tăng chiều cao hàng tiêu đề
-                # --- KẾT THÚC PHẦN TIÊU ĐỀ ---
-
-                # --- PHẦN CĂN GIỮA ẢNH ---
-                img = Image(img_file_in_memory)
-                # Neo ảnh vào cột G (thay vì A) để tạo lề trái
-                img_anchor_cell = f'G{current_row + 1}' 
+            print(f"Đang xử lý '{found_name}' (ID: {commodity_id})...")
+            cache_path = os.path.join(cache_dir, f"{commodity_id}.png")
+            entry = manifest['charts'].get(commodity_id, {})
+            image_data = None
+            remote = None
+        
+            # 1. Kiểm tra thay đổi bằng HTTP (ảnh cache chỉ dùng lại được nếu chart không đổi)
+            try:
+                changed, remote = breaker.call(check_chart_update, commodity_id, entry,
+                                               request_timeout=request_timeout,
+                                               timeout=request_timeout * 2,
+                                               deadline=deadline)
+                if not changed and os.path.exists(cache_path):
+                    print("  Chart không thay đổi -> dùng ảnh cache.")
+                    with open(cache_path, 'rb') as f:
+                        image_data = f.read()
+                    manifest['charts'][commodity_id] = remote
+            except Exception as e:
+                # Không kiểm tra được -> thử chụp lại như bình thường
+                print(f"  Không kiểm tra được thay đổi: {e}")
+        
+            # 2. Chart thay đổi (hoặc chưa có cache) -> screenshot bằng Selenium
+            if image_data is None:
+                try:
+                    if driver is None and driver_error is None:
+                        try:
+                            driver = start_driver_within(deadline)
+                        except Exception as e:
+                            # Không có trình duyệt -> vẫn tạo file từ ảnh cache
+                            driver_error = e
+                            print(f"LỖI: Không khởi động được trình duyệt ảo: {e}. Sẽ dùng ảnh cache.")
+                    if driver is None:
+                        raise RuntimeError("trình duyệt ảo không khả dụng")
+                    if deadline.expired():
+                        raise TimeoutError(f"hết thời gian cho phép của bước Sunsirs ({stage_deadline}s)")
+                    # Timeout tải trang không vượt quá thời gian còn lại của cả bước
+                    driver.set_page_load_timeout(max(1, min(page_load_timeout, deadline.remaining())))
                 
-                # Scale ảnh
-                img.width = original_width * scale_factor
-                img.height = original_height * scale_factor
+                    # Không bọc thêm thread: driver không dùng được song song, timeout do Selenium đảm nhận
+                    image_data = breaker.call(capture_chart_image, driver, commodity_id)
                 
-                ws.add_image(img, img_anchor_cell)
-                # --- KẾT THÚC PHẦN ẢNH ---
+                    if image_data:
+                        with open(cache_path, 'wb') as f:
+                            f.write(image_data)
+                        # Chỉ cập nhật manifest sau khi chụp thành công (lỗi -> lần sau kiểm tra lại)
+                        manifest['charts'][commodity_id] = remote or {}
                 
-                # Tăng số hàng (thêm 1 hàng cho tiêu đề)
-                rows_to_add = int((img.height / 15) + 3) # +3 để chừa chỗ cho tiêu đề
-                current_row += rows_to_add
+                except Exception as e:
+                    print(f"LỖI: Không thể chụp ảnh chart cho '{found_name}': {e}")
+                    if os.path.exists(cache_path):
+                        with open(cache_path, 'rb') as f:
+                            image_data = f.read()
+                        stale[found_name] = datetime.datetime.fromtimestamp(os.path.getmtime(cache_path))
+                        print(f"  Dùng ảnh cache (chụp lúc {stale[found_name]:%Y-%m-%d %H:%M}).")
             
-        except Exception as e:
-            print(f"LỖI: Không thể chụp ảnh chart cho '{found_name}': {e}")
-           
-    print(f"\nHoàn tất! Đang lưu file vào {output_filename}...")
-    wb.save(output_filename)
-    driver.quit()
-    print("Đã lưu file thành công.")
\ No newline at end of file
+            if image_data:
+                charts.append((found_name, image_data))
+    finally:
+        # Luôn đóng Chrome, kể cả khi có lỗi ngoài dự kiến trong vòng lặp
+        if driver is not None:
+            driver.quit()
+
+    # 3. Chỉ tạo lại file Excel khi nội dung (ảnh, tiêu đề STALE) khác lần trước
+    signature = [[name, hashlib.sha256(data).hexdigest(), name in stale] for name, data in charts]
+    workbook_info = manifest.get('workbooks', {}).get(os.path.basename(output_filename))
+    changed = not os.path.exists(output_filename) or workbook_info != signature
+
+    if changed:
+        write_charts_workbook(charts, stale, output_filename)
+        manifest.setdefault('workbooks', {})[os.path.basename(output_filename)] = signature
+    else:
+        print(f"\nKhông có chart nào thay đổi -> giữ nguyên file {output_filename}.")
+    save_manifest(manifest, cache_dir)
+    return stale, changed
@@ -7,14 +7,28 @@ from bokeh.embed import file_html
 from bokeh.resources import INLINE
 from openpyxl import Workbook
 import os
+import shutil
+import tempfile
 from io import BytesIO
 from openpyxl.styles import Font, PatternFill, Alignment
 from openpyxl.drawing.image import Image as OpenpyxlImage
+from openpyxl.chart import LineChart, Reference
+from openpyxl.chart.axis import DateAxis
+from indicators import INDICATOR_COLUMNS, INDICATORS_DIR, compute_indicators, load_or_compute_indicators
+from resampling import SESSION_START_HOUR, price_as_of, resolution_for_period, session_dates, to_resolution
+from analytics import ANALYTICS_LOOKBACK, build_close_pivot, write_analytics_sheet, create_correlation_heatmap
 
 
 # Set style cho matplotlib
 plt.style.use('seaborn-v0_8-darkgrid')
 
+# Màu các đường MA overlay trên biểu đồ Bokeh
+MA_COLORS = {
+    'MA20': '#FF9800',
+    'MA50': '#AB47BC',
+    'MA200': '#EC407A',
+}
+
 # Mapping tên commodity
 COMMODITY_NAMES = {
     'HRC=F': 'Hot Rolled Coil',
@@ -33,50 +47,86 @@ COMMODITY_NAMES = {
     'DX=F': 'Dollar Index',
 }
 
+# Cửa sổ tính returns theo LỊCH (không theo số dòng) -> đúng cho cả bar ngày lẫn intraday
+RETURN_WINDOWS = {
+    'Weekly': pd.DateOffset(weeks=1),
+    'Monthly': pd.DateOffset(months=1),
+    'YoY': pd.DateOffset(years=1),
+}
+
 def calculate_returns(prices):
-    """Tính các loại returns"""
-    df = pd.DataFrame({'Close': prices})
-    
-    # Daily return
-    df['Daily'] = df['Close'].pct_change() * 100
+    """
+    Tính các loại returns.
+    Các cửa sổ tính theo lịch: so với giá gần nhất tại/trước mốc (t - 1 tuần / 1 tháng / 1 năm),
+    Daily so với giá đóng cửa của PHIÊN giao dịch trước đó (phiên 18:00 -> 17:00, xem resampling.py).
+    """
+    df = pd.DataFrame({'Close': prices}).sort_index()
+    close = df['Close']
     
-    # Weekly return (5 trading days)
-    df['Weekly'] = df['Close'].pct_change(periods=5) * 100
+    # Tính theo giờ địa phương (bỏ timezone) để cộng/trừ theo lịch không bị lỗi DST với bar intraday
+    wall_time = df.index.tz_localize(None) if getattr(df.index, 'tz', None) is not None else df.index
+    wall_close = pd.Series(close.to_numpy(), index=wall_time)
     
-    # Monthly return (21 trading days)
-    df['Monthly'] = df['Close'].pct_change(periods=21) * 100
+    # Daily return (so với giá cuối cùng TRƯỚC khi phiên hiện tại mở cửa)
+    session_start = session_dates(wall_time) - pd.Timedelta(hours=24 - SESSION_START_HOUR)
+    prev_day_close = price_as_of(wall_close, session_start, inclusive=False)
+    df['Daily'] = (close / prev_day_close - 1) * 100
     
-    # YoY return (252 trading days)
-    df['YoY'] = df['Close'].pct_change(periods=252) * 100
+    # Weekly / Monthly / YoY return
+    for col, offset in RETURN_WINDOWS.items():
+        df[col] = (close / price_as_of(wall_close, wall_time - offset) - 1) * 100
     
     # YTD return
-    year_start = df.index.to_series().apply(lambda x: pd.Timestamp(year=x.year, month=1, day=1))
-    year_start_prices = df.groupby(year_start)['Close'].transform('first')
-    df['YTD'] = ((df['Close'] - year_start_prices) / year_start_prices * 100)
+    year_start_prices = close.groupby(wall_time.year).transform('first')
+    df['YTD'] = ((close - year_start_prices) / year_start_prices * 100)
     
     return df
 
-def create_bokeh_chart(commodity_data, commodity_name, output_html):
-    """Tạo biểu đồ interactive đẹp với Bokeh"""
-    from bokeh.models import ColumnDataSource, CrosshairTool, Range1d
-    from bokeh.models.formatters import DatetimeTickFormatter
-    
+def infer_date_format(index):
+    """Định dạng ngày hiển thị: có giờ:phút nếu là bar intraday, chỉ ngày nếu là bar ngày"""
+    has_time = len(index) > 0 and bool(((index.hour != 0) | (index.minute != 0)).any())
+    return '%Y-%m-%d %H:%M' if has_time else '%Y-%m-%d'
+
+def build_bokeh_source_data(commodity_data, date_format=None):
+    """
+    Chuẩn bị dữ liệu (dict các cột) cho ColumnDataSource của Bokeh.
+    'date_format' mặc định suy ra từ dữ liệu (xem infer_date_format).
+    """
     # Prepare data
     dates = commodity_data.index.to_pydatetime()
     prices = commodity_data['Close'].values
     daily_pct = commodity_data['Daily'].values
     
     # Format dates for display
-    date_strings = [d.strftime('%Y-%m-%d') for d in dates]
+    date_format = date_format or infer_date_format(commodity_data.index)
+    date_strings = [d.strftime(date_format) for d in dates]
     
-    # Create data source
-    source = ColumnDataSource(data={
+    data = {
         'x': dates,
         'y': prices,
         'date_str': date_strings,
         'daily_pct': daily_pct,
-        'daily_pct_str': [f"{x:+.2f}%" if pd.notna(x) else "N/A" for x in daily_pct]
-    })
+        'daily_pct_str': [f"{x:+.2f}%" if pd.notna(x) else "N/A" for x in daily_pct],
+        # Màu cho daily_pct trong tooltip
+        'daily_pct_color': ['#26A69A' if pd.notna(x) and x >= 0 else '#EF5350' if pd.notna(x) else '#787B86' for x in daily_pct],
+    }
+    
+    # Chỉ báo kỹ thuật (nếu đã được join vào commodity_data, xem indicators.py)
+    for col in INDICATOR_COLUMNS:
+        if col in commodity_data.columns:
+            data[col] = commodity_data[col].values
+    
+    return data
+
+def build_bokeh_figure(source, commodity_name):
+    """
+    Tạo figure Bokeh (style TradingView) từ một ColumnDataSource có sẵn.
+    Dùng chung cho file HTML tĩnh và Bokeh server (live_charts.py).
+    """
+    from bokeh.models import CrosshairTool, Range1d
+    from bokeh.models.formatters import DatetimeTickFormatter
+    
+    prices = pd.Series(source.data['y'])
     
     # Calculate price range with 5% padding
     price_min = prices.min()
@@ -103,6 +153,30 @@ def create_bokeh_chart(commodity_data, commodity_name, output_html):
     # Thêm fill area dưới line
     p.varea(x='x', y1=y_start, y2='y', source=source, alpha=0.1, color='#2962FF')
     
+    # Overlay các đường MA (nếu có)
+    ma_columns = [col for col in MA_COLORS if col in source.data]
+    for col in ma_columns:
+        p.line('x', col, source=source, line_width=1.5, color=MA_COLORS[col], alpha=0.8, legend_label=col)
+    
+    # Thêm Volatility / Drawdown / Z-score vào tooltip (nếu có)
+    indicator_tooltip = ""
+    if all(col in source.data for col in ['Volatility', 'Drawdown', 'ZScore']):
+        indicator_tooltip = """
+            <div style="display: flex; justify-content: space-between; gap: 20px; margin-top: 8px;">
+                <div>
+                    <div style="color: #787B86; font-size: 11px;">Volatility</div>
+                    <div style="color: #D1D4DC; font-size: 12px;">@Volatility{0.00}%</div>
+                </div>
+                <div>
+                    <div style="color: #787B86; font-size: 11px;">Drawdown</div>
+                    <div style="color: #D1D4DC; font-size: 12px;">@Drawdown{0.00}%</div>
+                </div>
+                <div>
+                    <div style="color: #787B86; font-size: 11px;">Z-Score</div>
+                    <div style="color: #D1D4DC; font-size: 12px;">@ZScore{0.00}</div>
+                </div>
+            </div>"""
+    
     # Hover tool với tooltip đẹp như TradingView
     hover = HoverTool(
         tooltips="""
@@ -117,7 +191,7 @@ def create_bokeh_chart(commodity_data, commodity_name, output_html):
                     <div style="color: #787B86; font-size: 11px;">Daily Change</div>
                     <div style="color: @daily_pct_color; font-size: 14px; font-weight: 600;">@daily_pct_str</div>
                 </div>
-            </div>
+            </div>""" + indicator_tooltip + """
         </div>
         """,
         formatters={'@x': 'datetime'},
@@ -126,9 +200,6 @@ def create_bokeh_chart(commodity_data, commodity_name, output_html):
         line_policy='nearest'
     )
     
-    # Add color for daily_pct in tooltip
-    source.data['daily_pct_color'] = ['#26A69A' if pd.notna(x) and x >= 0 else '#EF5350' if pd.notna(x) else '#787B86' for x in daily_pct]
-    
     p.add_tools(hover)
     
     # Crosshair styling
@@ -182,9 +253,28 @@ def create_bokeh_chart(commodity_data, commodity_name, output_html):
     p.xaxis.major_label_text_font_size = '11pt'
     p.yaxis.major_label_text_font_size = '11pt'
     
+    # Legend styling (chỉ có khi vẽ MA overlay)
+    if ma_columns:
+        p.legend.location = 'top_left'
+        p.legend.click_policy = 'hide'
+        p.legend.background_fill_color = '#1E222D'
+        p.legend.background_fill_alpha = 0.8
+        p.legend.border_line_color = '#363A45'
+        p.legend.label_text_color = '#B2B5BE'
+    
     # Toolbar styling
     p.toolbar.logo = None  # Remove Bokeh logo
     
+    return p
+
+def create_bokeh_chart(commodity_data, commodity_name, output_html):
+    """Tạo biểu đồ interactive đẹp với Bokeh"""
+    from bokeh.models import ColumnDataSource
+    
+    # Create data source
+    source = ColumnDataSource(data=build_bokeh_source_data(commodity_data))
+    p = build_bokeh_figure(source, commodity_name)
+    
     # Save to HTML as a 100% self-contained file
     print(f"    Đang tạo file HTML tự chứa (self-contained) cho: {commodity_name}")
     
@@ -199,27 +289,150 @@ def create_bokeh_chart(commodity_data, commodity_name, output_html):
 
     return output_html
 
+def create_matplotlib_image(commodity_data, title, y_min, y_max):
+    """Vẽ chart matplotlib (PNG, 120 dpi) để nhúng vào Excel. Trả về BytesIO."""
+    fig, ax = plt.subplots(figsize=(10, 6), dpi=100) # Giảm kích thước ảnh 1 chút
+    dates = commodity_data.index
+    prices = commodity_data['Close'].values
+    ax.plot(dates, prices, color='#3498DB', linewidth=2)
+    ax.fill_between(dates, prices, alpha=0.2, color='#3498DB')
+    ax.set_ylim(y_min, y_max)
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
+    ax.xaxis.set_major_locator(mdates.AutoDateLocator())
+    plt.xticks(rotation=45, ha='right')
+    ax.set_title(title, fontsize=16, pad=10)
+    ax.set_ylabel('Close Price ($)', fontsize=12)
+    ax.grid(True, alpha=0.3, linestyle='--')
+    ax.set_facecolor('#FAFAFA'); fig.patch.set_facecolor('white')
+    plt.tight_layout()
+    img_buffer = BytesIO()
+    plt.savefig(img_buffer, format='png', dpi=120, bbox_inches='tight')
+    img_buffer.seek(0)
+    plt.close(fig)
+    return img_buffer
+
+def add_native_line_chart(ws, data_ws, data_col, commodity_data, title, anchor_cell, y_min, y_max):
+    """
+    Ghi chuỗi Close vào sheet dữ liệu (ẩn) tại cột 'data_col' (Date) và 'data_col + 1' (Close),
+    rồi neo một LineChart gốc của Excel vào 'anchor_cell'.
+    Excel tự render chart -> Python không phải rasterize ảnh.
+    """
+    # Ghi dữ liệu: hàng 1 là header, dữ liệu từ hàng 2
+    data_ws.cell(row=1, column=data_col, value='Date')
+    data_ws.cell(row=1, column=data_col + 1, value=title)
+    for row_idx, (date, close) in enumerate(commodity_data['Close'].items(), start=2):
+        data_ws.cell(row=row_idx, column=data_col, value=date.date()).number_format = 'yyyy-mm-dd'
+        data_ws.cell(row=row_idx, column=data_col + 1, value=float(close))
+    last_row = len(commodity_data) + 1
+    
+    chart = LineChart()
+    chart.title = title
+    chart.style = 2
+    chart.legend = None
+    chart.width = 15.9   # ~600px
+    chart.height = 9.5   # ~360px
+    chart.y_axis.title = 'Close Price ($)'
+    chart.y_axis.scaling.min = y_min
+    chart.y_axis.scaling.max = y_max
+    chart.y_axis.number_format = '#,##0.00'
+    chart.y_axis.crossAx = 500
+    chart.x_axis = DateAxis(crossAx=100)
+    chart.x_axis.number_format = 'mmm-yy'
+    chart.x_axis.majorTimeUnit = 'months'
+    # openpyxl >= 3.1 mặc định ẩn trục -> bật lại
+    chart.x_axis.delete = False
+    chart.y_axis.delete = False
+    
+    values = Reference(data_ws, min_col=data_col + 1, min_row=1, max_row=last_row)
+    dates = Reference(data_ws, min_col=data_col, min_row=2, max_row=last_row)
+    chart.add_data(values, titles_from_data=True)
+    chart.set_categories(dates)
+    
+    series = chart.series[0]
+    series.graphicalProperties.line.solidFill = '3498DB'
+    series.graphicalProperties.line.width = 20000 # EMU (~1.5pt)
+    series.smooth = False
+    
+    ws.add_chart(chart, anchor_cell)
+    return chart
+
+def iter_commodity_frames(df):
+    """Tách DataFrame dạng long thành từng cặp (ticker, DataFrame), theo thứ tự xuất hiện"""
+    for commodity_code, frame in df.groupby('name', sort=False):
+        yield commodity_code, frame.sort_index()
+
 def create_commodity_charts(df, 
                             output_file='commodity_charts.xlsx', 
                             period_years=1, 
                             upload_mode=False,
                             local_html_folder='charts_html',
                             github_repo_local_path=None,
-                            github_pages_url=None
+                            github_pages_url=None,
+                            indicators=None,
+                            chart_mode='image',
+                            stale=None,
+                            include_analytics=True,
+                            image_spill_dir=None,
+                            indicators_cache=INDICATORS_DIR
                            ):
     """
     Vẽ biểu đồ và tạo BẢNG TÓM TẮT cho TẤT CẢ commodities
     vào MỘT sheet duy nhất.
     
     Layout: Chart bên trái (Cột A), Bảng data bên phải (Cột L).
+    
+    'indicators': kết quả của compute_indicators / load_or_compute_indicators (indicators.py).
+    Nếu không truyền, sẽ tính một lượt cho tất cả commodities trước vòng lặp.
+    
+    'chart_mode':
+        'image'  -> nhúng ảnh PNG matplotlib (như cũ).
+        'native' -> ghi chuỗi Close vào sheet ẩn 'Chart Data' và dùng LineChart gốc của Excel
+                    (không rasterize, file nhỏ hơn nhiều).
+    
+    'stale': dict {ticker: ngày dữ liệu cuối} cho các ticker tải lỗi và đang dùng dữ liệu cache
+    -> tiêu đề được đánh dấu STALE trong file Excel.
+    
+    'include_analytics': thêm sheet tương quan/spread + trang heatmap Bokeh (analytics.py).
+    
+    CHẾ ĐỘ STREAMING: nếu 'df' là generator/iterable các cặp (ticker, DataFrame) thay vì DataFrame,
+    từng commodity được xử lý (returns -> chart -> ghi Excel) ngay khi nhận được, bộ nhớ đỉnh
+    chỉ cỡ dữ liệu của 1 commodity. Ảnh PNG được ghi ra 'image_spill_dir' (mặc định: thư mục tạm)
+    và openpyxl chỉ giữ đường dẫn tới lúc wb.save. Chỉ báo của từng commodity đi qua cache
+    tăng dần 'indicators_cache' (load_or_compute_indicators) -> chỉ tính các bar mới.
     """
+    stale = {} if stale is None else stale
+    if chart_mode not in ('image', 'native'):
+        raise ValueError(f"LỖI: chart_mode không hợp lệ: '{chart_mode}' (chỉ nhận 'image' hoặc 'native').")
+    
+    # Dữ liệu có thể là intraday -> vẽ ở độ phân giải phù hợp với khoảng thời gian (vd: 1 năm -> bar ngày)
+    resolution = resolution_for_period(pd.Timedelta(days=365 * period_years))
+    
+    streaming = not isinstance(df, pd.DataFrame)
+    cleanup_spill_dir = False
+    if streaming:
+        records = df
+        indicators_by_name = None
+        if chart_mode == 'image' and image_spill_dir is None:
+            image_spill_dir = tempfile.mkdtemp(prefix='commodity_charts_')
+            cleanup_spill_dir = True
+    else:
+        # Đảm bảo date là index
+        if 'date' in df.columns:
+            df = df.set_index('date')
+        
+        df = to_resolution(df, resolution)
+        
+        # Chỉ báo kỹ thuật: tính 1 lượt vectorized cho tất cả, KHÔNG tính trong vòng lặp
+        if indicators is None:
+            indicators = compute_indicators(df)
+        indicators_by_name = {name: group.drop(columns='name') for name, group in indicators.groupby('name')}
+        records = iter_commodity_frames(df)
     
-    # Đảm bảo date là index
-    if 'date' in df.columns:
-        df = df.set_index('date')
+    if image_spill_dir:
+        os.makedirs(image_spill_dir, exist_ok=True)
     
-    commodities = df['name'].unique()
-    cutoff_date = df.index.max() - pd.DateOffset(years=period_years)
+    # Chỉ giữ lại đuôi chuỗi Close (ANALYTICS_LOOKBACK bar) của mỗi commodity cho sheet tương quan/spread
+    close_series = {}
     
     # === THAY ĐỔI 1: TẠO 1 SHEET DUY NHẤT BÊN NGOÀI VÒNG LẶP ===
     wb = Workbook()
@@ -227,6 +440,12 @@ def create_commodity_charts(df,
     ws.title = "Yahoo Finance Summary"
     
     current_row = 1 # Khởi tạo biến đếm hàng
+    
+    # Sheet ẩn chứa dữ liệu cho chart native
+    data_ws = None
+    if chart_mode == 'native':
+        data_ws = wb.create_sheet("Chart Data")
+        data_ws.sheet_state = 'hidden'
 
     # Kiểm tra cấu hình dựa trên chế độ (giữ nguyên)
     if upload_mode:
@@ -240,38 +459,44 @@ def create_commodity_charts(df,
         os.makedirs(local_html_folder, exist_ok=True)
         print("--- Đang chạy ở chế độ LOCAL ---")
 
-    for idx, commodity_code in enumerate(commodities):
+    for idx, (commodity_code, commodity_frame) in enumerate(records):
         commodity_name = COMMODITY_NAMES.get(commodity_code, commodity_code)
         full_name = f"{commodity_name} ({commodity_code})"
         
         print(f"Đang xử lý {full_name}...")
         
-        commodity_data_full = df[df['name'] == commodity_code].copy().sort_index()
-        commodity_data_full = calculate_returns(commodity_data_full['Close'])
+        if streaming:
+            if 'date' in commodity_frame.columns:
+                commodity_frame = commodity_frame.set_index('date')
+            commodity_frame = to_resolution(commodity_frame.sort_index(), resolution)
+            commodity_indicators = load_or_compute_indicators(commodity_frame, indicators_cache).drop(columns='name')
+        else:
+            commodity_indicators = indicators_by_name.get(commodity_code)
+        
+        commodity_data_full = calculate_returns(commodity_frame['Close'])
+        if commodity_indicators is not None:
+            commodity_data_full = commodity_data_full.join(commodity_indicators)
+        cutoff_date = commodity_data_full.index.max() - pd.DateOffset(years=period_years)
         commodity_data = commodity_data_full[commodity_data_full.index >= cutoff_date].copy()
+        # Chỉ giữ phần đuôi mà sheet phân tích cần -> bộ nhớ giữ lại không phụ thuộc độ dài lịch sử
+        close_series[commodity_code] = commodity_data_full['Close'].iloc[-ANALYTICS_LOOKBACK:]
         
-        # === 1. TẠO MATPLOTLIB CHART (Giữ nguyên) ===
-        fig, ax = plt.subplots(figsize=(10, 6), dpi=100) # Giảm kích thước ảnh 1 chút
-        dates = commodity_data.index
+        # === 1. CHART CHO EXCEL ===
         prices = commodity_data['Close'].values
-        ax.plot(dates, prices, color='#3498DB', linewidth=2)
-        ax.fill_between(dates, prices, alpha=0.2, color='#3498DB')
         price_min = prices.min(); price_max = prices.max()
         price_range = price_max - price_min
         y_min = price_min - price_range * 0.1; y_max = price_max + price_range * 0.1
-        ax.set_ylim(y_min, y_max)
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-        ax.xaxis.set_major_locator(mdates.AutoDateLocator())
-        plt.xticks(rotation=45, ha='right')
-        ax.set_title(f'{full_name} - Last {period_years} Year(s)', fontsize=16, pad=10)
-        ax.set_ylabel('Close Price ($)', fontsize=12)
-        ax.grid(True, alpha=0.3, linestyle='--')
-        ax.set_facecolor('#FAFAFA'); fig.patch.set_facecolor('white')
-        plt.tight_layout()
-        img_buffer = BytesIO()
-        plt.savefig(img_buffer, format='png', dpi=120, bbox_inches='tight')
-        img_buffer.seek(0)
-        plt.close(fig)
+        chart_title = f'{full_name} - Last {period_years} Year(s)'
+        
+        img_buffer = None
+        if chart_mode == 'image':
+            img_buffer = create_matplotlib_image(commodity_data, chart_title, y_min, y_max)
+            if image_spill_dir:
+                # Ghi PNG ra đĩa ngay, openpyxl chỉ giữ đường dẫn (đọc lại lúc wb.save) -> giải phóng bộ nhớ
+                img_path = os.path.join(image_spill_dir, f"{commodity_code.replace('=', '_')}.png")
+                with open(img_path, 'wb') as f:
+                    f.write(img_buffer.getvalue())
+                img_buffer = img_path
         
         # === 2. TẠO BOKEH INTERACTIVE CHART (VÀ LINK) (Giữ nguyên) ===
         html_filename = f"{commodity_code.replace('=', '_')}.html"
@@ -292,12 +517,17 @@ def create_commodity_charts(df,
         
         # === 3. GHI VÀO EXCEL (LOGIC MỚI) ===
         
-        # --- A. Tiêu đề (Gộp A đến T) ---
-        ws.merge_cells(f'A{current_row}:T{current_row}')
+        # --- A. Tiêu đề (Gộp A đến X) ---
+        ws.merge_cells(f'A{current_row}:X{current_row}')
         cell_title = ws[f'A{current_row}']
         cell_title.value = full_name
         cell_title.font = Font(bold=True, size=16, color='2C3E50')
         cell_title.alignment = Alignment(horizontal='left', vertical='center')
+        if commodity_code in stale:
+            # Dữ liệu cũ (tải lỗi, dùng cache) -> đánh dấu rõ ràng
+            cell_title.value = f"{full_name}  ⚠ STALE - dữ liệu cũ, cập nhật lần cuối: {stale[commodity_code]:%Y-%m-%d}"
+            cell_title.font = Font(bold=True, size=16, color='C0392B')
+            cell_title.fill = PatternFill(start_color='FDEBD0', end_color='FDEBD0', fill_type='solid')
         ws.row_dimensions[current_row].height = 25
         
         current_row += 1 # Sang hàng mới
@@ -322,19 +552,24 @@ def create_commodity_charts(df,
         # ANCHOR (mỏ neo) cho cả ảnh và bảng
         anchor_row = current_row
         
-        # C1. Thêm Ảnh (Bên Trái)
-        # Neo ảnh vào cột A
-        img = OpenpyxlImage(img_buffer)
-        img.width = 600  # 10 * 60 (Rộng 10 cột, từ A-J)
-        img.height = 360 # 24 * 15 (Cao 24 hàng)
-        ws.add_image(img, f'A{anchor_row}')
+        # C1. Thêm Chart (Bên Trái)
+        if chart_mode == 'native':
+            # Mỗi commodity dùng 2 cột (Date, Close) trong sheet ẩn
+            add_native_line_chart(ws, data_ws, 2 * idx + 1, commodity_data, chart_title, f'A{anchor_row}', y_min, y_max)
+        else:
+            # Neo ảnh vào cột A
+            img = OpenpyxlImage(img_buffer)
+            img.width = 600  # 10 * 60 (Rộng 10 cột, từ A-J)
+            img.height = 360 # 24 * 15 (Cao 24 hàng)
+            ws.add_image(img, f'A{anchor_row}')
         
         # C2. Thêm Bảng (Bên Phải)
         # Bắt đầu bảng từ cột L (cách cột A 11 cột)
         table_start_col = 12 # Cột L
 
         # Header bảng
-        headers = ['Date', 'Close', 'Daily %', 'Weekly %', 'Monthly %', 'YoY %', 'YTD %']
+        headers = ['Date', 'Close', 'Daily %', 'Weekly %', 'Monthly %', 'YoY %', 'YTD %',
+                   'MA20', 'MA50', 'MA200', 'Vol %', 'Drawdown %', 'Z-Score']
         header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
         header_font = Font(bold=True, color='FFFFFF')
         
@@ -358,6 +593,12 @@ def create_commodity_charts(df,
             ws.cell(row=data_row, column=table_start_col + 5, value=float(row['YoY']) if pd.notna(row['YoY']) else None).number_format = '0.00'
             ws.cell(row=data_row, column=table_start_col + 6, value=float(row['YTD']) if pd.notna(row['YTD']) else None).number_format = '0.00'
             
+            # Chỉ báo kỹ thuật
+            for offset, col in enumerate(INDICATOR_COLUMNS, start=7):
+                value = row.get(col)
+                number_format = '#,##0.00' if col.startswith('MA') else '0.00'
+                ws.cell(row=data_row, column=table_start_col + offset, value=float(value) if pd.notna(value) else None).number_format = number_format
+            
             # Tô màu
             for col in range(2, 7): # Cột Daily -> YTD
                 cell = ws.cell(row=data_row, column=table_start_col + col)
@@ -377,9 +618,27 @@ def create_commodity_charts(df,
     ws.column_dimensions['M'].width = 12 # Cột Close
     for col in ['N', 'O', 'P', 'Q', 'R']: # Cột %
         ws.column_dimensions[col].width = 11
+    for col in ['S', 'T', 'U', 'V', 'W', 'X']: # Cột chỉ báo
+        ws.column_dimensions[col].width = 11
+    
+    # === SHEET TƯƠNG QUAN & SPREAD (tính từ MỘT bảng pivot giá Close) ===
+    if include_analytics and len(close_series) > 1:
+        print("Đang tính tương quan & spread...")
+        pivot = build_close_pivot(close_series)
+        heatmap_filename = "correlation_heatmap.html"
+        if upload_mode:
+            heatmap_save_path = os.path.join(github_repo_local_path, heatmap_filename)
+            heatmap_link = github_pages_url + heatmap_filename
+        else:
+            heatmap_save_path = os.path.join(local_html_folder, heatmap_filename)
+            heatmap_link = os.path.abspath(heatmap_save_path)
+        create_correlation_heatmap(pivot, heatmap_save_path, names=COMMODITY_NAMES)
+        write_analytics_sheet(wb, pivot, names=COMMODITY_NAMES, heatmap_link=heatmap_link)
 
     # Save Excel
     wb.save(output_file)
+    if cleanup_spill_dir:
+        shutil.rmtree(image_spill_dir, ignore_errors=True)
     print(f"\\n✅ Đã xuất thành công file Excel (local): {output_file}")
-    print(f"📊 Tổng số commodity: {len(commodities)}")
-    print(f"📁 Excel file: {output_file}")
\ No newline at end of file
+    print(f"📊 Tổng số commodity: {len(close_series)}")
+    print(f"📁 Excel file: {output_file}")
@@ -0,0 +1,103 @@
+import pandas as pd
+import yfinance as yf
+from fetch_guard import CircuitBreaker
+
+
+# Yahoo giới hạn độ dài lịch sử cho dữ liệu intraday -> lấy tối đa cho phép
+INTRADAY_MAX_PERIOD = {
+    '15m': '60d',
+    '1h': '730d',
+}
+
+# Timeout cho mỗi request HTTP tới Yahoo (giây)
+REQUEST_TIMEOUT = 30
+
+
+def fetch_yahoo_history(ticker, period='2y', interval='1d', request_timeout=REQUEST_TIMEOUT):
+    """
+    Tải lịch sử giá 1 ticker từ Yahoo Finance ở độ phân giải 'interval'
+    ('1d' hoặc intraday '1h' / '15m'). Trả về DataFrame index 'date', cột OHLCV + 'name'.
+    """
+    if interval in INTRADAY_MAX_PERIOD:
+        period = INTRADAY_MAX_PERIOD[interval]
+
+    a = yf.Ticker(ticker).history(period=period, interval=interval, timeout=request_timeout)
+    if a.empty:
+        # yfinance không raise khi lỗi mạng/ticker lỗi mà trả về DataFrame rỗng
+        raise ValueError(f"Yahoo không trả về dữ liệu cho '{ticker}'")
+
+    a.index.name = 'date'
+    a['name'] = ticker
+    return a
+
+
+def iter_fetch_with_fallback(tickers, period='2y', intervals=None, load_cached=None,
+                             breaker=None, deadline=None, request_timeout=REQUEST_TIMEOUT, stale=None):
+    """
+    Generator: tải lần lượt từng ticker và yield (ticker, DataFrame) ngay khi có,
+    để các bước sau (returns, chart, ghi Excel) chạy luôn mà không chờ cả danh sách.
+    Mỗi ticker bị giới hạn thời gian và đi qua circuit breaker.
+    Ticker lỗi -> dùng lại dữ liệu cũ từ 'load_cached(ticker)' (nếu có) và ghi vào dict 'stale'
+    {ticker: ngày dữ liệu cuối cùng trong cache}.
+    'deadline' chỉ tính thời gian TẢI: trong lúc bên gọi xử lý 1 ticker (giữa 2 lần next()) đồng hồ được tạm dừng.
+    """
+    intervals = intervals or {}
+    breaker = breaker or CircuitBreaker('Yahoo Finance')
+    stale = {} if stale is None else stale
+
+    for ticker in tickers:
+        try:
+            a = breaker.call(fetch_yahoo_history, ticker,
+                             period=period,
+                             interval=intervals.get(ticker, '1d'),
+                             request_timeout=request_timeout,
+                             timeout=request_timeout * 2, # yfinance có thể gửi nhiều request cho 1 ticker
+                             deadline=deadline)
+        except Exception as e:
+            print(f"  LỖI: Không tải được '{ticker}': {e}")
+            try:
+                a = load_cached(ticker) if load_cached is not None else None
+            except Exception as cache_error:
+                print(f"    Không đọc được dữ liệu cache cho '{ticker}': {cache_error}")
+                a = None
+            if a is None or a.empty:
+                print(f"    Không có dữ liệu cache cho '{ticker}'. Bỏ qua.")
+                continue
+            stale[ticker] = a.index.max()
+            print(f"    Dùng dữ liệu cache (cập nhật lần cuối: {stale[ticker]:%Y-%m-%d}).")
+
+        if deadline is not None:
+            deadline.pause()
+        try:
+            yield ticker, a
+        finally:
+            if deadline is not None:
+                deadline.resume()
+
+
+def fetch_all_with_fallback(tickers, period='2y', intervals=None, cached_history=None,
+                            breaker=None, deadline=None, request_timeout=REQUEST_TIMEOUT):
+    """
+    Như iter_fetch_with_fallback nhưng gom tất cả vào 1 DataFrame.
+    'cached_history' là lịch sử lần chạy trước (dạng long) dùng khi ticker tải lỗi.
+
+    Trả về (history, stale): 'stale' là dict {ticker: ngày dữ liệu cuối cùng trong cache}.
+    """
+    load_cached = None
+    if cached_history is not None:
+        load_cached = lambda ticker: cached_history[cached_history['name'] == ticker]
+
+    stale = {}
+    part = [a for _, a in iter_fetch_with_fallback(tickers,
+                                                   period=period,
+                                                   intervals=intervals,
+                                                   load_cached=load_cached,
+                                                   breaker=breaker,
+                                                   deadline=deadline,
+                                                   request_timeout=request_timeout,
+                                                   stale=stale)]
+
+    if not part:
+        raise RuntimeError("LỖI: Không có dữ liệu cho bất kỳ ticker nào (kể cả cache).")
+
+    return pd.concat(part), stale